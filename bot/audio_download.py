@@ -0,0 +1,53 @@
+import asyncio
+import os
+
+import aiofiles
+import aiohttp
+
+from config.logger_config import logger
+
+logger = logger.getChild("audio_download")
+
+
+class AudioDownloader:
+    """Downloads voice notes over one shared keep-alive HTTP session.
+
+    Bodies are streamed to disk in chunks instead of being buffered in
+    memory, and a batch of files is fetched concurrently.
+    """
+
+    def __init__(self, max_connections=10, chunk_size=64 * 1024, timeout=60):
+        self.max_connections = max_connections
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._session = None
+
+    def get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def download(self, url, path):
+        """Stream url into path; the file only appears once it is complete."""
+        part_path = f"{path}.part"
+        async with self.get_session().get(url) as response:
+            response.raise_for_status()
+            async with aiofiles.open(part_path, "wb") as audio_file:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    await audio_file.write(chunk)
+        os.replace(part_path, path)
+        logger.debug(f"Downloaded audio file: {path}")
+        return path
+
+    async def download_all(self, downloads):
+        """Download (url, path) pairs concurrently and return the paths."""
+        return list(
+            await asyncio.gather(*(self.download(url, path) for url, path in downloads))
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
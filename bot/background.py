@@ -0,0 +1,68 @@
+import asyncio
+
+from config.logger_config import logger
+
+logger = logger.getChild("background")
+
+
+class BackgroundTasks:
+    """Registry of named background tasks.
+
+    Holds a strong reference to every running task (the event loop only keeps
+    weak ones), logs failures and lets handlers look up and await a task that
+    was started by an earlier update. A finished task is kept for
+    finished_ttl seconds, then dropped with its result, so results nobody
+    collects do not pile up in memory.
+    """
+
+    def __init__(self, finished_ttl=30 * 60):
+        self.finished_ttl = finished_ttl
+        self.tasks = {}
+
+    def spawn(self, key, coro, finished_ttl=None):
+        """Start coro in the background under key unless one is already running.
+
+        finished_ttl overrides how long the finished task is kept; 0 drops it
+        right away, for work whose result is persisted elsewhere.
+        """
+        task = self.tasks.get(key)
+        if task is not None and not task.done():
+            logger.debug(f"Background task {key} already running")
+            coro.close()
+            return task
+
+        if finished_ttl is None:
+            finished_ttl = self.finished_ttl
+        task = asyncio.create_task(coro, name=key)
+        self.tasks[key] = task
+        task.add_done_callback(lambda done: self._on_done(key, done, finished_ttl))
+        logger.info(f"Started background task {key}")
+        return task
+
+    def get(self, key):
+        """Return the task stored under key, running or finished, if any."""
+        return self.tasks.get(key)
+
+    def pop(self, key):
+        return self.tasks.pop(key, None)
+
+    def _forget(self, key, task):
+        # A newer task may have been spawned under the same key since
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+
+    def _on_done(self, key, task, finished_ttl):
+        if finished_ttl > 0:
+            task.get_loop().call_later(finished_ttl, self._forget, key, task)
+        else:
+            self._forget(key, task)
+
+        if task.cancelled():
+            logger.info(f"Background task {key} cancelled")
+        elif task.exception() is not None:
+            logger.error(
+                f"Background task {key} failed: {task.exception()}",
+                exc_info=task.exception(),
+            )
+        else:
+            logger.info(f"Background task {key} finished")
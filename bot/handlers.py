@@ -1,9 +1,8 @@
+import asyncio
 import json
 import os
-import tempfile
-import google.generativeai as genai
+import time
 
-import requests
 import stripe
 from aiogram import Bot, Router
 from aiogram.filters import Command, CommandStart
@@ -24,6 +23,10 @@ from bot.constants import (
     get_report_text,
 )
 
+from bot.audio_download import AudioDownloader
+from bot.background import BackgroundTasks
+from bot.payments import CheckoutSessionCache
+
 # Create PDF for mini report
 from bot.pdf_generator import generate_pdf_content
 from bot.question_utils import (
@@ -32,6 +35,7 @@ from bot.question_utils import (
     is_audio_question,
     is_essay_question,
 )
+from bot.report_pipeline import ReportPipeline, Stage, hash_input
 from bot.validators import (
     validate_age,
     validate_email,
@@ -41,58 +45,63 @@ from bot.validators import (
     validate_voice_message,
 )
 from config.logger_config import logger
+from openai_api.schemas import CombinedAnalysis, RubricAnalysis, StudyPlan
+from openai_api.usage import ModeStats, track_usage
 
 # Configure structured logging
 logger = logger.getChild("handlers")
 
+# Times an agent is asked before an unparseable answer fails the call
+PARSE_ATTEMPTS = 2
+
+# Default number of analysis agents allowed to run at the same time
+DEFAULT_ANALYSIS_CONCURRENCY = 5
+
+# Local copies of the users' voice answers
+AUDIO_DIR = "audio"
+
+# Latency and token totals of the separate and combined text analysis modes
+analysis_mode_stats = ModeStats()
+
+# Shared keep-alive session for fetching voice notes from Telegram
+audio_downloader = AudioDownloader()
+
+# Checkout session URLs reused until the session expires
+checkout_sessions = CheckoutSessionCache()
+
+# Work started ahead of the user asking for it, keyed by "<kind>:<username>"
+background_tasks = BackgroundTasks()
+
 
 async def handle_voice_message(message: Message, tg_bot_token):
     out = await message.bot.get_file(message.voice.file_id)
     return f"https://api.telegram.org/file/bot{tg_bot_token}/{out.file_path}"
 
 
-async def create_payment_button(username: str, bot_username: str):
-    """Create Stripe payment session and return payment button markup."""
-    # Create Stripe payment session
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[
-            {
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": "Полная диагностика",
-                        "description": "Полная диагностика английского языка с персональным планом обучения",
-                    },
-                    "unit_amount": 999,  # $9.99 in cents
-                },
-                "quantity": 1,
-            }
-        ],
-        mode="payment",
-        success_url=f"https://t.me/{bot_username}?start=payment_success_{username}",
-        cancel_url=f"https://t.me/{bot_username}?start=payment_cancel_{username}",
-        client_reference_id=username,
-    )
+async def create_payment_button(username: str, bot_username: str, chat_id: int):
+    """Return payment button markup for the user's Stripe checkout session."""
+    session_url = await checkout_sessions.get_url(username, bot_username, chat_id)
 
     # Create payment button with direct Stripe URL
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
                 InlineKeyboardButton(
-                    text="Получить полный отчет за $9.99", url=session.url
+                    text="Получить полный отчет за $9.99", url=session_url
                 )
             ]
         ]
     )
 
 
-async def mini_report_handler(
-    db_manager, general_agent, username, bot_username, user_message_time
-):
-    logger.info(f"Generating mini report for user {username}")
+def parse_mini_report_response(response):
+    logger.debug(f"General agent response: {response}")
+    return json.loads(response.split("<evaluation>")[1].split("</evaluation>")[0])
+
+
+async def get_mini_report_analysis(db_manager, general_agent, username):
     # Get raw responses
-    raw_responses = db_manager.get_all_user_responses(username)
+    raw_responses = await db_manager.get_all_user_responses(username)
     logger.debug(f"Raw responses: {raw_responses}")
 
     # Format responses as question-answer pairs
@@ -101,19 +110,36 @@ async def mini_report_handler(
         formatted_responses[ESSAY_QUESTIONS[i]] = response
     logger.debug(f"Formatted responses: {formatted_responses}")
     # Get analysis from general agent
-    general_response = general_agent.handle_message(str(formatted_responses))
-    logger.debug(f"General agent response: {general_response}")
-    general_analysis = json.loads(
-        general_response.split("<evaluation>")[1].split("</evaluation>")[0]
+    general_analysis = await ask_agent(
+        general_agent, str(formatted_responses), parse_mini_report_response
     )
     logger.debug(f"General agent analysis: {general_analysis}")
+    return general_analysis
+
+
+async def mini_report_handler(
+    db_manager, general_agent, username, bot_username, user_message_time, chat_id
+):
+    logger.info(f"Generating mini report for user {username}")
+    # Use the analysis started when the last essay was accepted, if any
+    general_analysis = None
+    task = background_tasks.pop(f"mini_report:{username}")
+    if task is not None:
+        try:
+            general_analysis = await asyncio.shield(task)
+        except Exception as e:
+            logger.warning(f"Background mini report failed for {username}: {str(e)}")
+    if general_analysis is None:
+        general_analysis = await get_mini_report_analysis(
+            db_manager, general_agent, username
+        )
 
     english_level = general_analysis["english_level"]
     mistake_count = general_analysis["mistakes_count"]
     problem_areas = general_analysis["weakest_areas"]
     months_to_fix = general_analysis["months_to_improve"]
 
-    payment_button = await create_payment_button(username, bot_username)
+    payment_button = await create_payment_button(username, bot_username, chat_id)
 
     return (
         get_report_text(
@@ -140,6 +166,351 @@ def process_assistant_response(response):
     return evaluation, feedback
 
 
+class AnalysisError(Exception):
+    """Raised when one or more analysis agents fail.
+
+    Keeps the per-agent errors and the results of the agents that did succeed.
+    """
+
+    def __init__(self, errors, results):
+        self.errors = errors
+        self.results = results
+        super().__init__(
+            "Analysis failed for agents: "
+            + ", ".join(f"{name} ({error})" for name, error in errors.items())
+        )
+
+
+async def ask_agent(assistant_manager, message, parse, attempts=PARSE_ATTEMPTS):
+    """Send message to the agent and parse its answer.
+
+    An answer that fails to parse or validate is dropped from the cache and
+    only this call is asked again, up to attempts times.
+    """
+    for attempt in range(1, attempts + 1):
+        response = await assistant_manager.handle_message(message)
+        try:
+            return parse(response)
+        except Exception as e:
+            await assistant_manager.invalidate(message)
+            if attempt == attempts:
+                raise
+            logger.warning(
+                f"Invalid answer from {assistant_manager.assistant_id} "
+                f"(attempt {attempt}/{attempts}): {str(e)}"
+            )
+
+
+def parse_rubric_analysis(response):
+    return RubricAnalysis.model_validate_json(response).to_result()
+
+
+async def analyze_text(assistant_manager, formatted_responses):
+    if assistant_manager.response_model is not None:
+        parse = parse_rubric_analysis
+    else:
+        parse = process_assistant_response
+    return await ask_agent(assistant_manager, formatted_responses, parse)
+
+
+def parse_combined_response(response, rubrics):
+    """Split a combined analysis answer into each rubric's (evaluation, feedback)."""
+    results = {}
+    for rubric in rubrics:
+        start = response.find(f"<{rubric}>")
+        end = response.find(f"</{rubric}>")
+        if start == -1 or end == -1:
+            raise ValueError(f"Combined analysis has no {rubric} block")
+        results[rubric] = process_assistant_response(
+            response[start + len(f"<{rubric}>") : end]
+        )
+    return results
+
+
+def parse_structured_combined_response(response, rubrics):
+    analysis = CombinedAnalysis.model_validate_json(response)
+    return {rubric: getattr(analysis, rubric).to_result() for rubric in rubrics}
+
+
+def parse_structured_study_plan(response):
+    return StudyPlan.model_validate_json(response).to_report()
+
+
+def parse_study_plan_response(response):
+    logger.debug(f"Study plan before JSON: {response}")
+    eval_start = response.find("<output>") + len("<output>")
+    eval_end = response.find("</output>")
+    return json.loads(response[eval_start:eval_end])
+
+
+def audio_path(username, index):
+    """Local blob store path of the user's index-th voice answer."""
+    return os.path.join(AUDIO_DIR, f"{username}_{index}.ogg")
+
+
+async def wait_for_audio_ingestion(username, count):
+    """Wait for background ingestion of the user's voice answers to settle."""
+    for index in range(count):
+        task = background_tasks.pop(f"audio:{username}:{index}")
+        if task is None:
+            continue
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            logger.warning(f"Audio ingestion failed for {username} #{index}: {e}")
+
+
+async def download_audio_files(username, audio_files):
+    """Return local paths of the user's voice answers, downloading any missing."""
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    await wait_for_audio_ingestion(username, len(audio_files))
+    paths = [audio_path(username, i) for i in range(len(audio_files))]
+    missing = [
+        (url, path) for url, path in zip(audio_files, paths) if not os.path.exists(path)
+    ]
+    if missing:
+        await audio_downloader.download_all(missing)
+    return paths
+
+
+async def ingest_audio(username, index, url, audio_evaluator=None):
+    """Fetch a voice answer into the blob store as soon as it is received.
+
+    The Telegram file link may expire before the report is generated, and
+    fetching it here keeps the download (and, given audio_evaluator, the
+    Gemini upload) off the report's critical path.
+    """
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    path = audio_path(username, index)
+    await audio_downloader.download(url, path)
+    # Clips sent inline never go through the File API
+    if audio_evaluator is not None and not audio_evaluator.is_inline(path):
+        await audio_evaluator.get_uploaded(path)
+    return path
+
+
+def store_analysis_result(db_manager, username, agent, input_hash, call):
+    """Wrap an agent call so its parsed result is persisted as soon as it arrives."""
+
+    async def run():
+        result = await call()
+        await db_manager.save_analysis_result(username, agent, input_hash, list(result))
+        return result
+
+    return run
+
+
+async def run_agents_concurrently(agent_calls, semaphore):
+    """Run independent agent calls concurrently, as many at once as semaphore allows.
+
+    Args:
+        agent_calls (dict): Agent name mapped to a zero-argument coroutine factory
+        semaphore (asyncio.Semaphore): Limits the number of calls in flight
+
+    Returns:
+        tuple: (results, errors) dictionaries keyed by agent name
+    """
+
+    async def run(name, call):
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                logger.error(f"Agent {name} failed: {str(e)}", exc_info=True)
+                return name, None, e
+            logger.debug(
+                f"Agent {name} finished in {time.monotonic() - start:.2f}s: {result}"
+            )
+            return name, result, None
+
+    outcomes = await asyncio.gather(
+        *(run(name, call) for name, call in agent_calls.items())
+    )
+    results = {name: result for name, result, error in outcomes if error is None}
+    errors = {name: error for name, _, error in outcomes if error is not None}
+    return results, errors
+
+
+def build_analysis_stages(
+    db_manager,
+    username,
+    vocabulary_assistant_manager,
+    tense_assistant_manager,
+    style_assistant_manager,
+    grammar_assistant_manager,
+    audio_evaluator,
+    study_plan_assistant_manager,
+    max_concurrency,
+    combined_analysis=None,
+):
+    """Build the analysis stages of the full report pipeline.
+
+    The text agents stage also keeps each agent's result, so retrying it only
+    calls the agents that failed. With combined_analysis the missing rubrics
+    are evaluated by a single call instead of one call per agent. The text
+    agents and the audio path run at the same time and share one limit of
+    max_concurrency model calls in flight. Stored results and checkpoints of
+    agent stages are keyed by the agents' instructions version too, so they
+    are not reused once a prompt or response schema changes.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    text_agent_managers = {
+        "vocabulary": vocabulary_assistant_manager,
+        "tense": tense_assistant_manager,
+        "style": style_assistant_manager,
+        "grammar": grammar_assistant_manager,
+    }
+
+    async def get_text_agent_versions():
+        versions = await asyncio.gather(
+            *(
+                agent.get_instructions_version()
+                for agent in text_agent_managers.values()
+            )
+        )
+        return dict(zip(text_agent_managers, versions))
+
+    async def text_agents_version():
+        return json.dumps(await get_text_agent_versions(), sort_keys=True)
+
+    async def text_agents(formatted_responses):
+        agent_calls = {
+            agent_name: (lambda agent=agent: analyze_text(agent, formatted_responses))
+            for agent_name, agent in text_agent_managers.items()
+        }
+
+        # Reuse results stored by an earlier run for the same inputs and
+        # agent instructions
+        versions = await get_text_agent_versions()
+        input_hashes = {
+            name: hash_input(f"{versions[name]}\n{formatted_responses}")
+            for name in agent_calls
+        }
+        stored = await db_manager.get_analysis_results(username, input_hashes)
+        results = {name: tuple(result) for name, result in stored.items()}
+        if results:
+            logger.info(f"Reusing stored results for {username}: {list(results)}")
+
+        missing = [name for name in agent_calls if name not in results]
+        mode = "combined" if combined_analysis is not None else "separate"
+        start = time.monotonic()
+        with track_usage() as usage:
+            if combined_analysis is not None and missing:
+                if combined_analysis.response_model is not None:
+                    parse_combined = parse_structured_combined_response
+                else:
+                    parse_combined = parse_combined_response
+                new_results = await ask_agent(
+                    combined_analysis,
+                    formatted_responses,
+                    lambda response: parse_combined(response, missing),
+                )
+                for name, result in new_results.items():
+                    await db_manager.save_analysis_result(
+                        username, name, input_hashes[name], list(result)
+                    )
+                errors = {}
+            else:
+                new_results, errors = await run_agents_concurrently(
+                    {
+                        name: store_analysis_result(
+                            db_manager, username, name, input_hashes[name], call
+                        )
+                        for name, call in agent_calls.items()
+                        if name in missing
+                    },
+                    semaphore,
+                )
+        results.update(new_results)
+        if errors:
+            raise AnalysisError(errors, results)
+        if missing:
+            latency = time.monotonic() - start
+            analysis_mode_stats.record(mode, latency, usage)
+            logger.info(
+                f"Text analysis ({mode}) for {username} took {latency:.2f}s, "
+                f"{usage.calls} calls, {usage.total_tokens} tokens; "
+                f"per mode: {analysis_mode_stats.stats()}"
+            )
+
+        return {
+            name: {"evaluation": evaluation, "feedback": feedback}
+            for name, (evaluation, feedback) in results.items()
+        }
+
+    async def audio_download(audio_files):
+        return await download_audio_files(username, audio_files)
+
+    async def gemini_upload(audio_download):
+        async with semaphore:
+            return await audio_evaluator.prepare(audio_download)
+
+    async def audio_evaluation(gemini_upload):
+        async with semaphore:
+            response = await audio_evaluator.evaluate(AUDIO_QUESTIONS, gemini_upload)
+        evaluation, feedback = process_assistant_response(response)
+        return {"evaluation": evaluation, "feedback": feedback}
+
+    async def study_plan(text_agents, audio_evaluation):
+        study_plan_response = {
+            "vocabulary": text_agents["vocabulary"],
+            "tenses": text_agents["tense"],
+            "style": text_agents["style"],
+            "grammar": text_agents["grammar"],
+            "pronunciation": audio_evaluation,
+        }
+        if study_plan_assistant_manager.response_model is not None:
+            parse = parse_structured_study_plan
+        else:
+            parse = parse_study_plan_response
+        return await ask_agent(
+            study_plan_assistant_manager, json.dumps(study_plan_response), parse
+        )
+
+    # Model calls are retried by retry_call and invalid agent answers by
+    # ask_agent, so those stages do not retry them a second time
+    return [
+        Stage(
+            "text_agents",
+            text_agents,
+            inputs=("formatted_responses",),
+            retries=0,
+            version=text_agents_version,
+        ),
+        Stage(
+            "audio_download",
+            audio_download,
+            inputs=("audio_files",),
+            retries=3,
+            is_valid=lambda paths: all(os.path.exists(path) for path in paths),
+        ),
+        Stage(
+            "gemini_upload",
+            gemini_upload,
+            inputs=("audio_download",),
+            retries=0,
+            is_valid=audio_evaluator.is_usable,
+        ),
+        # Only an unparseable evaluation is worth asking for again
+        Stage(
+            "audio_evaluation",
+            audio_evaluation,
+            inputs=("gemini_upload",),
+            retries=1,
+            retry_on=(ValueError,),
+            version=audio_evaluator.get_instructions_version,
+        ),
+        Stage(
+            "study_plan",
+            study_plan,
+            inputs=("text_agents", "audio_evaluation"),
+            retries=0,
+            version=study_plan_assistant_manager.get_instructions_version,
+        ),
+    ]
+
+
 async def get_analysis_data(
     db_manager,
     username,
@@ -147,12 +518,16 @@ async def get_analysis_data(
     tense_assistant_manager,
     style_assistant_manager,
     grammar_assistant_manager,
-    audio_model_genai,
+    audio_evaluator,
     study_plan_assistant_manager,
+    max_concurrency=DEFAULT_ANALYSIS_CONCURRENCY,
+    combined_analysis=None,
 ):
     logger.info(f"Getting analysis data for user {username}")
     REMOVE_LATER = 1
-    user_info = db_manager.get_user_info(username, len(BASIC_QUESTIONS) + REMOVE_LATER)
+    user_info = await db_manager.get_user_info(
+        username, len(BASIC_QUESTIONS) + REMOVE_LATER
+    )
     logger.debug(f"User info: {user_info}")
 
     name = user_info[0]
@@ -160,7 +535,7 @@ async def get_analysis_data(
     email = user_info[2]
 
     # Extract user responses into a dictionary
-    responses_list = db_manager.get_all_user_responses(username)
+    responses_list = await db_manager.get_all_user_responses(username)
     logger.debug(f"Responses list: {responses_list}")
     # Get analysis from each AI agent
     logger.debug(f"Starting AI analysis for user {username}")
@@ -176,111 +551,84 @@ async def get_analysis_data(
 
     logger.debug(f"Formatted responses: {formatted_responses}")
 
-    # Process all analyses
-    vocabulary_evaluation, vocabulary_feedback = process_assistant_response(
-        vocabulary_assistant_manager.handle_message(formatted_responses)
-    )
-    logger.debug(f"Vocab evaluation: {vocabulary_evaluation}")
-    logger.debug(f"Vocab feedback: {vocabulary_feedback}")
-    tense_evaluation, tense_feedback = process_assistant_response(
-        tense_assistant_manager.handle_message(formatted_responses)
-    )
-    logger.debug(f"Tense evaluation: {tense_evaluation}")
-    logger.debug(f"Tense feedback: {tense_feedback}")
-    style_evaluation, style_feedback = process_assistant_response(
-        style_assistant_manager.handle_message(formatted_responses)
-    )
-    logger.debug(f"Style evaluation: {style_evaluation}")
-    logger.debug(f"Style feedback: {style_feedback}")
-    grammar_evaluation, grammar_feedback = process_assistant_response(
-        grammar_assistant_manager.handle_message(formatted_responses)
-    )
-    logger.debug(f"Grammar evaluation: {grammar_evaluation}")
-    logger.debug(f"Grammar feedback: {grammar_feedback}")
-
     # Get all audio responses
     audio_files = responses_list[-len(AUDIO_QUESTIONS) :]
     logger.debug(f"Audio files: {audio_files}")
-    prompts = []
 
-    for i, url in enumerate(audio_files):
-        response = requests.get(url)
-        if response.status_code == 200:
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_file:
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
-            logger.debug(f"Temporary file path: {temp_file_path}")
+    pipeline = ReportPipeline(
+        db_manager,
+        username,
+        build_analysis_stages(
+            db_manager,
+            username,
+            vocabulary_assistant_manager,
+            tense_assistant_manager,
+            style_assistant_manager,
+            grammar_assistant_manager,
+            audio_evaluator,
+            study_plan_assistant_manager,
+            max_concurrency,
+            combined_analysis,
+        ),
+    )
+    context = await pipeline.run(
+        {"formatted_responses": formatted_responses, "audio_files": audio_files}
+    )
+    logger.debug(f"Study plan after JSON: {context['study_plan']}")
+
+    logger.debug(f"Completed AI analysis for user {username}")
 
-            try:
-                # Upload the temporary file
-                audio_file = genai.upload_file(temp_file_path)
-                logger.debug(f"Uploaded audio file: {audio_file}")
-                prompts.append(f"{AUDIO_QUESTIONS[i]}: {audio_file}")
-                logger.debug(f"{AUDIO_QUESTIONS[i]}: {audio_file}")
-            finally:
-                # Clean up the temporary file
-                os.unlink(temp_file_path)
-
-    logger.debug(f"Prompts: {prompts}")
-
-    audio_response = audio_model_genai.generate_content(prompts).text
-    audio_evaluation, audio_feedback = process_assistant_response(audio_response)
-    logger.debug(f"Audio evaluation: {audio_evaluation}")
-    logger.debug(f"Audio feedback: {audio_feedback}")
-
-    # """MOCK DATA"""
-    # vocabulary_evaluation = agent_data.vocabulary_evaluation
-    # vocabulary_feedback = agent_data.vocabulary_feedback
-    # grammar_evaluation = agent_data.grammar_evaluation
-    # grammar_feedback = agent_data.grammar_feedback
-    # tense_evaluation = agent_data.tense_evaluation
-    # tense_feedback = agent_data.tense_feedback
-    # style_evaluation = agent_data.style_evaluation
-    # style_feedback = agent_data.style_feedback
-    # study_plan = agent_data.study_plan
-    # audio_evaluation = agent_data.audio_evaluation
-    # audio_feedback = agent_data.audio_feedback
-    # """MOCK DATA"""
-
-    study_plan_response = {
-        "vocabulary": {
-            "evaluation": vocabulary_evaluation,
-            "feedback": vocabulary_feedback,
-        },
-        "tenses": {"evaluation": tense_evaluation, "feedback": tense_feedback},
-        "style": {"evaluation": style_evaluation, "feedback": style_feedback},
-        "grammar": {"evaluation": grammar_evaluation, "feedback": grammar_feedback},
-        "pronunciation": {
-            "evaluation": audio_evaluation,
-            "feedback": audio_feedback,
-        },
+    return {
+        "user_info": {"name": name, "age": age, "email": email, "username": username},
+        "vocabulary": context["text_agents"]["vocabulary"],
+        "grammar": context["text_agents"]["grammar"],
+        "audio": context["audio_evaluation"],
+        "tense": context["text_agents"]["tense"],
+        "style": context["text_agents"]["style"],
+        "study_plan": context["study_plan"],
     }
 
-    study_plan = study_plan_assistant_manager.handle_message(
-        json.dumps(study_plan_response)
+
+async def get_analysis_version(*agents):
+    """Combined instructions version of the agents behind a full analysis."""
+    versions = await asyncio.gather(
+        *(agent.get_instructions_version() for agent in agents)
     )
-    logger.debug(f"Study plan before JSON: {study_plan}")
-    eval_start = study_plan.find("<output>") + len("<output>")
-    eval_end = study_plan.find("</output>")
-    study_plan = json.loads(study_plan[eval_start:eval_end])
+    return hash_input(",".join(versions))[:16]
 
-    logger.debug(f"Study plan after JSON: {study_plan}")
 
-    logger.debug("Completed AI analysis for user {username}")
+async def precompute_full_report(db_manager, username, *analysis_args):
+    """Compute the full-report analysis ahead of payment and persist it.
 
-    return {
-        "user_info": {"name": name, "age": age, "email": email, "username": username},
-        "vocabulary": {
-            "evaluation": vocabulary_evaluation,
-            "feedback": vocabulary_feedback,
-        },
-        "grammar": {"evaluation": grammar_evaluation, "feedback": grammar_feedback},
-        "audio": {"evaluation": audio_evaluation, "feedback": audio_feedback},
-        "tense": {"evaluation": tense_evaluation, "feedback": tense_feedback},
-        "style": {"evaluation": style_evaluation, "feedback": style_feedback},
-        "study_plan": study_plan,
-    }
+    analysis_args are the get_analysis_data arguments after username; the
+    stored analysis is tagged with the version of its six agents.
+    """
+    logger.info(f"Precomputing full report analysis for user {username}")
+    try:
+        version = await get_analysis_version(*analysis_args[:6])
+        analysis_data = await get_analysis_data(db_manager, username, *analysis_args)
+    except Exception:
+        await db_manager.mark_precompute_failed(username)
+        raise
+    await db_manager.save_precomputed_analysis(username, analysis_data, version)
+    return analysis_data
+
+
+async def get_precomputed_analysis(db_manager, username, version):
+    """Return precomputed analysis data, waiting for a run still in progress.
+
+    Analysis made by agents of another version (e.g. before a prompt edit)
+    is not returned.
+    """
+    task = background_tasks.pop(f"full_report:{username}")
+    if task is not None:
+        try:
+            # The run stores its analysis before finishing
+            await asyncio.shield(task)
+        except Exception as e:
+            logger.warning(f"Precomputed analysis unusable for {username}: {str(e)}")
+            return None
+    return await db_manager.get_precomputed_analysis(username, version)
 
 
 async def full_report_handler(
@@ -290,66 +638,94 @@ async def full_report_handler(
     tense_assistant_manager,
     style_assistant_manager,
     grammar_assistant_manager,
-    audio_model_genai,
+    audio_evaluator,
     study_plan_assistant_manager,
+    max_concurrency=DEFAULT_ANALYSIS_CONCURRENCY,
+    combined_analysis=None,
 ):
-    # Get analysis data
-    analysis_data = await get_analysis_data(
-        db_manager,
-        username,
+    # Reuse a speculative precomputation if one exists for the current agents
+    version = await get_analysis_version(
         vocabulary_assistant_manager,
         tense_assistant_manager,
         style_assistant_manager,
         grammar_assistant_manager,
-        audio_model_genai,
+        audio_evaluator,
         study_plan_assistant_manager,
     )
+    analysis_data = await get_precomputed_analysis(db_manager, username, version)
+    if analysis_data is None:
+        analysis_data = await get_analysis_data(
+            db_manager,
+            username,
+            vocabulary_assistant_manager,
+            tense_assistant_manager,
+            style_assistant_manager,
+            grammar_assistant_manager,
+            audio_evaluator,
+            study_plan_assistant_manager,
+            max_concurrency,
+            combined_analysis,
+        )
     logger.debug(f"Analysis data: {analysis_data}")
-    # Generate PDF content
-    pdf_path = generate_pdf_content(analysis_data)
+
+    async def pdf(analysis_data):
+        # Generate PDF content
+        return await asyncio.to_thread(generate_pdf_content, analysis_data)
+
+    pipeline = ReportPipeline(
+        db_manager,
+        username,
+        [
+            Stage(
+                "pdf",
+                pdf,
+                inputs=("analysis_data",),
+                retries=1,
+                is_valid=os.path.exists,
+            )
+        ],
+    )
+    context = await pipeline.run({"analysis_data": analysis_data})
+    pdf_path = context["pdf"]
     logger.debug(f"PDF path1: {pdf_path}")
     return pdf_path
 
 
 async def generate_full_report(
-    message: Message, username: str, db_manager, **assistants
+    bot: Bot, chat_id: int, username: str, db_manager, **assistants
 ):
-    """Generate and send full report to user after successful payment."""
-    try:
-        await message.answer(
-            "Генерация полного отчета... Это может занять около минуты."
-        )
-        pdf_path = await full_report_handler(
-            db_manager,
-            username,
-            assistants["vocabulary_assistant_manager"],
-            assistants["tense_assistant_manager"],
-            assistants["style_assistant_manager"],
-            assistants["grammar_assistant_manager"],
-            assistants["audio_model_genai"],
-            assistants["study_plan_assistant_manager"],
-        )
-        logger.debug(f"PDF path2: {pdf_path}")
+    """Generate and send full report to user after successful payment.
+
+    Runs inside a report queue worker; exceptions propagate so the job is
+    retried.
+    """
+    pdf_path = await full_report_handler(
+        db_manager,
+        username,
+        assistants["vocabulary_assistant_manager"],
+        assistants["tense_assistant_manager"],
+        assistants["style_assistant_manager"],
+        assistants["grammar_assistant_manager"],
+        assistants["audio_evaluator"],
+        assistants["study_plan_assistant_manager"],
+        assistants.get("max_concurrency", DEFAULT_ANALYSIS_CONCURRENCY),
+        assistants.get("combined_analysis"),
+    )
+    logger.debug(f"PDF path2: {pdf_path}")
 
+    try:
         # Send the PDF report
-        await message.answer_document(
+        await bot.send_document(
+            chat_id,
             FSInputFile(pdf_path),
             caption="Ваш полный отчет готов! Спасибо за использование English Buddy AI.",
         )
-
-        # Mark report as sent
-        db_manager.mark_report_sent(username)
-
+    finally:
         # Clean up the file
         os.remove(pdf_path)
-        return True
 
-    except Exception as e:
-        logger.error(f"Error generating full report: {str(e)}")
-        await message.answer(
-            "Произошла ошибка при генерации отчета. Пожалуйста, напишите в поддержку."
-        )
-        return False
+    # Mark report as sent
+    await db_manager.mark_report_sent(username)
 
 
 def setup_router(
@@ -357,13 +733,21 @@ def setup_router(
     tense_assistant_manager,
     style_assistant_manager,
     grammar_assistant_manager,
-    audio_model_genai,
+    audio_evaluator,
     mini_report_assistant_manager,
     study_plan_assistant_manager,
     db_manager,
     tg_bot_token,
     bot_username,
     stripe_secret_key,
+    report_queue,
+    analysis_concurrency=DEFAULT_ANALYSIS_CONCURRENCY,
+    precompute_full_report_enabled=False,
+    precompute_daily_limit=0,
+    combined_analysis=None,
+    eager_audio_ingest=True,
+    audio_preupload=False,
+    stripe_webhook_enabled=False,
 ):
     router = Router()
     logger.info("Initializing router and handlers")
@@ -372,6 +756,36 @@ def setup_router(
     stripe.api_key = stripe_secret_key
     logger.info(f"Stripe API key set: {stripe_secret_key}")
 
+    async def process_report_job(bot: Bot, job):
+        await generate_full_report(
+            bot,
+            job["chat_id"],
+            job["username"],
+            db_manager,
+            vocabulary_assistant_manager=vocabulary_assistant_manager,
+            tense_assistant_manager=tense_assistant_manager,
+            style_assistant_manager=style_assistant_manager,
+            grammar_assistant_manager=grammar_assistant_manager,
+            audio_evaluator=audio_evaluator,
+            study_plan_assistant_manager=study_plan_assistant_manager,
+            max_concurrency=analysis_concurrency,
+            combined_analysis=combined_analysis,
+        )
+
+    async def notify_report_failed(bot: Bot, job):
+        await bot.send_message(
+            job["chat_id"],
+            "Произошла ошибка при генерации отчета. Пожалуйста, напишите в поддержку.",
+        )
+
+    report_queue.set_handler(process_report_job, notify_report_failed)
+
+    async def queue_full_report(message: Message, username: str):
+        await report_queue.enqueue(username, message.chat.id)
+        await message.answer(
+            "Генерация полного отчета... Это может занять около минуты."
+        )
+
     @router.message(
         lambda message: message.text and message.text.startswith("/start payment_")
     )
@@ -379,23 +793,35 @@ def setup_router(
         username = message.from_user.username
         status = message.text.split("_")[1]  # success or cancel
 
-        if status == "success":
+        if status == "success" and stripe_webhook_enabled:
+            # The deep link can be spoofed; only the verified webhook marks
+            # the user as paid, and it has usually queued the report already.
+            # The link only queues it for sessions the webhook could not, and
+            # never after a report job has run, so no second report is sent.
+            logger.info(f"User {username} returned from checkout")
+            if not await db_manager.check_payment_status(username):
+                await message.answer(
+                    "Спасибо! Мы подтверждаем оплату, полный отчет придет автоматически."
+                )
+            elif await report_queue.enqueue(username, message.chat.id, only_once=True):
+                await message.answer("Спасибо за оплату! Генерирую ваш полный отчет...")
+                await message.answer(
+                    "Генерация полного отчета... Это может занять около минуты."
+                )
+            else:
+                await message.answer(
+                    "Спасибо за оплату! Полный отчет уже формируется "
+                    "или отправлен в этот чат."
+                )
+
+        elif status == "success":
             logger.info(f"Payment successful for user {username}")
-            db_manager.update_payment_status(username, True)
+            await db_manager.update_payment_status(username, True)
+            checkout_sessions.invalidate(username)
 
             await message.answer("Спасибо за оплату! Генерирую ваш полный отчет...")
 
-            await generate_full_report(
-                message,
-                username,
-                db_manager,
-                vocabulary_assistant_manager=vocabulary_assistant_manager,
-                tense_assistant_manager=tense_assistant_manager,
-                style_assistant_manager=style_assistant_manager,
-                grammar_assistant_manager=grammar_assistant_manager,
-                audio_model_genai=audio_model_genai,
-                study_plan_assistant_manager=study_plan_assistant_manager,
-            )
+            await queue_full_report(message, username)
 
         elif status == "cancel":
             logger.info(f"Payment cancelled for user {username}")
@@ -407,7 +833,7 @@ def setup_router(
         logger.info(f"User {username} started the bot")
 
         # Check if user has already started the questionnaire
-        current_question = db_manager.get_current_question(username)
+        current_question = await db_manager.get_current_question(username)
 
         if current_question > 0:
             logger.info(
@@ -421,25 +847,52 @@ def setup_router(
                 "Привет! Я бот English Buddy AI. Давайте оценим ваши навыки английского языка и создадим персонализированный план обучения."
             )
             await message.answer(BASIC_QUESTIONS[0])
-            db_manager.update_current_question(username, 1)
+            await db_manager.update_current_question(username, 1)
             logger.debug(f"Initial question sent to user {username}")
 
+    async def start_full_report_precompute(username: str):
+        if not await db_manager.claim_precompute_slot(username, precompute_daily_limit):
+            logger.info(f"Skipping full report precompute for user {username}")
+            return
+
+        # The analysis is persisted in precomputed_reports, so the finished
+        # task is not kept in memory for users who never pay
+        background_tasks.spawn(
+            f"full_report:{username}",
+            precompute_full_report(
+                db_manager,
+                username,
+                vocabulary_assistant_manager,
+                tense_assistant_manager,
+                style_assistant_manager,
+                grammar_assistant_manager,
+                audio_evaluator,
+                study_plan_assistant_manager,
+                analysis_concurrency,
+                combined_analysis,
+            ),
+            finished_ttl=0,
+        )
+
     async def mini_report(message: Message):
         username = message.from_user.username
         logger.info(f"Mini report started for user {username}")
 
-        # Generate new report if none exists
-        await message.answer("Генерация краткого отчета... Пожалуйста, подождите.")
+        # Only ask the user to wait if the background analysis isn't ready yet
+        task = background_tasks.get(f"mini_report:{username}")
+        if task is None or not task.done():
+            await message.answer("Генерация краткого отчета... Пожалуйста, подождите.")
         report_text, payment_button = await mini_report_handler(
             db_manager,
             mini_report_assistant_manager,
             message.from_user.username,
             bot_username,
             message.date.timestamp(),
+            message.chat.id,
         )
 
         await message.answer(report_text, reply_markup=payment_button)
-        db_manager.mark_mini_report_sent(username)  # Mark mini report as sent
+        await db_manager.mark_mini_report_sent(username)  # Mark mini report as sent
 
     @router.message()
     async def handle_user_interaction(message: Message):
@@ -460,7 +913,7 @@ def setup_router(
             )
 
     async def process_user_message(message: Message, username: str):
-        current_question = db_manager.get_current_question(username)
+        current_question = await db_manager.get_current_question(username)
 
         if current_question == 0:
             logger.debug(f"User {username} hasn't started questionnaire")
@@ -520,7 +973,7 @@ def setup_router(
                 await message.reply(error_messages[current_question])
                 return
 
-        db_manager.save_user_info(username, current_question, message.text)
+        await db_manager.save_user_info(username, current_question, message.text)
 
         if current_question == len(BASIC_QUESTIONS):
             keyboard = InlineKeyboardMarkup(
@@ -533,7 +986,7 @@ def setup_router(
         else:
             await message.answer(BASIC_QUESTIONS[current_question])
 
-        db_manager.update_current_question(username, current_question + 1)
+        await db_manager.update_current_question(username, current_question + 1)
 
     async def handle_essay_questions(
         message: Message, username: str, current_question: int
@@ -550,9 +1003,17 @@ def setup_router(
         essay_q_num = get_essay_question_number(
             current_question, len(BASIC_QUESTIONS), len(BASIC_QUESTIONS_CHOICES)
         )
-        db_manager.save_user_response(username, essay_q_num, message.text)
+        await db_manager.save_user_response(username, essay_q_num, message.text)
 
         if essay_q_num == len(ESSAY_QUESTIONS) - 1:
+            # The mini report only needs the essays, so start it while the
+            # user records the audio answers
+            background_tasks.spawn(
+                f"mini_report:{username}",
+                get_mini_report_analysis(
+                    db_manager, mini_report_assistant_manager, username
+                ),
+            )
             await message.answer(
                 "Пожалуйста, запишите аудио ответ на английском языке на следующий вопрос:\n\n"
                 + AUDIO_QUESTIONS[0]
@@ -563,7 +1024,7 @@ def setup_router(
                 + ESSAY_QUESTIONS[essay_q_num + 1]
             )
 
-        db_manager.update_current_question(username, current_question + 1)
+        await db_manager.update_current_question(username, current_question + 1)
 
     async def handle_audio_questions(
         message: Message, username: str, current_question: int
@@ -582,13 +1043,27 @@ def setup_router(
 
         # Save the file URL to database
         file_url = await handle_voice_message(message, tg_bot_token)
-        db_manager.save_user_response(
+        await db_manager.save_user_response(
             username, audio_q_num + len(ESSAY_QUESTIONS), file_url
         )
+        if eager_audio_ingest:
+            background_tasks.spawn(
+                f"audio:{username}:{audio_q_num}",
+                ingest_audio(
+                    username,
+                    audio_q_num,
+                    file_url,
+                    audio_evaluator if audio_preupload else None,
+                ),
+                # The clip stays on disk, and any upload in gemini_uploads
+                finished_ttl=0,
+            )
 
-        db_manager.update_current_question(username, current_question + 1)
+        await db_manager.update_current_question(username, current_question + 1)
 
         if audio_q_num == len(AUDIO_QUESTIONS) - 1:
+            if precompute_full_report_enabled:
+                await start_full_report_precompute(username)
             await message.answer("Спасибо за заполнение анкеты!\n\n")
             await mini_report(message)
         else:
@@ -602,16 +1077,16 @@ def setup_router(
     ):
         if not message.text or not message.text.startswith("/"):
             # Check if mini report has been sent
-            has_mini_report = db_manager.check_mini_report_sent(username)
+            has_mini_report = await db_manager.check_mini_report_sent(username)
             if not has_mini_report:
                 await mini_report(message)
                 return
 
             # Check if user has already paid
-            has_paid = db_manager.check_payment_status(username)
+            has_paid = await db_manager.check_payment_status(username)
             if has_paid:
                 # Check if user has received their report
-                has_received_report = db_manager.check_report_sent(username)
+                has_received_report = await db_manager.check_report_sent(username)
                 if has_received_report:
                     await message.answer(
                         "Вы уже приобрели полный отчет. Если вам нужна помощь, напишите в поддержку @akhatsuleimenov."
@@ -620,19 +1095,11 @@ def setup_router(
                     await message.answer(
                         "Вы уже оплатили отчет. Сейчас я его сгенерирую для вас."
                     )
-                    await generate_full_report(
-                        message,
-                        username,
-                        db_manager,
-                        vocabulary_assistant_manager=vocabulary_assistant_manager,
-                        tense_assistant_manager=tense_assistant_manager,
-                        style_assistant_manager=style_assistant_manager,
-                        grammar_assistant_manager=grammar_assistant_manager,
-                        audio_model_genai=audio_model_genai,
-                        study_plan_assistant_manager=study_plan_assistant_manager,
-                    )
+                    await queue_full_report(message, username)
             else:
-                payment_button = await create_payment_button(username, bot_username)
+                payment_button = await create_payment_button(
+                    username, bot_username, message.chat.id
+                )
                 await message.answer(
                     "Вы уже заполнили опросник!\n\n"
                     "Чтобы получить полный отчет, нажмите кнопку ниже:",
@@ -645,7 +1112,7 @@ def setup_router(
         logger.info(f"Received callback from user {username}: {callback_query.data}")
 
         try:
-            current_question = db_manager.get_current_question(username)
+            current_question = await db_manager.get_current_question(username)
             choice_q_num = current_question - len(BASIC_QUESTIONS) - 1
 
             # Determine if this is one of the last two questions
@@ -669,7 +1136,7 @@ def setup_router(
     async def process_choice_selection(
         callback_query, username: str, is_multi_select: bool
     ):
-        current_question = db_manager.get_current_question(username)
+        current_question = await db_manager.get_current_question(username)
         choice_q_num = current_question - len(BASIC_QUESTIONS) - 1
 
         if not (choice_q_num >= 0 and choice_q_num < len(BASIC_QUESTIONS_CHOICES)):
@@ -768,8 +1235,10 @@ def setup_router(
                             reply_markup=keyboard,
                         )
                 # Only update DB if message edit/send was successful
-                db_manager.save_user_info(username, current_question, actual_answer)
-                db_manager.update_current_question(username, current_question + 1)
+                await db_manager.save_user_info(
+                    username, current_question, actual_answer
+                )
+                await db_manager.update_current_question(username, current_question + 1)
                 await callback_query.answer()
 
             except Exception as e:
@@ -779,7 +1248,7 @@ def setup_router(
                 )
 
     async def process_choices_submission(callback_query, username: str):
-        current_question = db_manager.get_current_question(username)
+        current_question = await db_manager.get_current_question(username)
         choice_q_num = current_question - len(BASIC_QUESTIONS) - 1
 
         # Collect all selected options
@@ -837,10 +1306,10 @@ def setup_router(
                     )
 
             # Only update DB if message edit/send was successful
-            db_manager.save_user_info(
+            await db_manager.save_user_info(
                 username, current_question, ", ".join(selected_options)
             )
-            db_manager.update_current_question(username, current_question + 1)
+            await db_manager.update_current_question(username, current_question + 1)
             await callback_query.answer()
 
         except Exception as e:
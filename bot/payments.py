@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import stripe
+
+from config.logger_config import logger
+
+logger = logger.getChild("payments")
+
+# Checkout sessions are created to expire after this long (Stripe allows 30
+# minutes to 24 hours) and are not handed out in their last minutes
+CHECKOUT_SESSION_TTL = 23 * 60 * 60
+CHECKOUT_SESSION_MARGIN = 10 * 60
+
+
+def create_checkout_session(username, bot_username, chat_id, expires_at):
+    """Create the Stripe checkout session for the full report (blocking)."""
+    return stripe.checkout.Session.create(
+        payment_method_types=["card"],
+        line_items=[
+            {
+                "price_data": {
+                    "currency": "usd",
+                    "product_data": {
+                        "name": "Полная диагностика",
+                        "description": "Полная диагностика английского языка с персональным планом обучения",
+                    },
+                    "unit_amount": 999,  # $9.99 in cents
+                },
+                "quantity": 1,
+            }
+        ],
+        mode="payment",
+        success_url=f"https://t.me/{bot_username}?start=payment_success_{username}",
+        cancel_url=f"https://t.me/{bot_username}?start=payment_cancel_{username}",
+        client_reference_id=username,
+        # Lets the payment webhook deliver the report without the deep link
+        metadata={"chat_id": str(chat_id)},
+        expires_at=int(expires_at),
+    )
+
+
+class CheckoutSessionCache:
+    """Per-user checkout session URLs, reused until the session expires.
+
+    Sessions are created in a worker thread so the Stripe call does not block
+    the event loop; concurrent requests for the same user share one call.
+    """
+
+    def __init__(self, ttl=CHECKOUT_SESSION_TTL, margin=CHECKOUT_SESSION_MARGIN):
+        self.ttl = ttl
+        self.margin = margin
+        self.sessions = {}
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_url(self, username, bot_username, chat_id):
+        cached = self.sessions.get(username)
+        if cached is not None and cached[1] - self.margin > time.time():
+            self.hits += 1
+            logger.debug(f"Reusing checkout session for user {username}")
+            return cached[0]
+
+        task = self._pending.get(username)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._create(username, bot_username, chat_id))
+            self._pending[username] = task
+            task.add_done_callback(lambda _: self._pending.pop(username, None))
+        return await asyncio.shield(task)
+
+    async def _create(self, username, bot_username, chat_id):
+        session = await asyncio.to_thread(
+            create_checkout_session,
+            username,
+            bot_username,
+            chat_id,
+            time.time() + self.ttl,
+        )
+        logger.info(f"Created checkout session {session.id} for user {username}")
+        self.sessions[username] = (session.url, session.expires_at)
+        return session.url
+
+    def invalidate(self, username):
+        """Forget the user's session, e.g. once it has been paid."""
+        self.sessions.pop(username, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "sessions": len(self.sessions),
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+
+from config.logger_config import logger
+
+logger = logger.getChild("report_pipeline")
+
+
+def hash_input(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class Stage:
+    """One step of the report pipeline.
+
+    Args:
+        name (str): Stage name, also the context key its output is stored under
+        run (callable): Coroutine function called with the stage inputs as
+            keyword arguments; must return a JSON-serializable value
+        inputs (tuple): Context keys passed to run
+        retries (int): Extra attempts after the first failure
+        retry_delay (float): Seconds before the first retry, doubled each time
+        is_valid (callable): Optional check that a checkpoint is still usable
+        retry_on (tuple): Exception types that are retried; anything else fails
+            the stage at once. Stages whose model calls already go through
+            retry_call should not retry those failures again here.
+        version (callable): Optional coroutine function returning the version
+            of what produces the output (e.g. an agent's instructions); it is
+            part of the checkpoint key, so a new version is not served an old
+            checkpoint
+    """
+
+    def __init__(
+        self,
+        name,
+        run,
+        inputs=(),
+        retries=2,
+        retry_delay=2,
+        is_valid=None,
+        retry_on=(Exception,),
+        version=None,
+    ):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.is_valid = is_valid
+        self.retry_on = retry_on
+        self.version = version
+
+
+class StageFailed(Exception):
+    """Raised when a stage fails after exhausting its retry budget."""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+        super().__init__(f"Stage {stage} failed: {error}")
+
+
+class ReportPipeline:
+    """Runs stages as soon as their inputs are ready, checkpointing each output.
+
+    A stage depends on the earlier stages named in its inputs and starts once
+    those have finished, so independent branches (e.g. the text agents and the
+    audio path) run at the same time. Stages must be listed after the stages
+    they depend on.
+
+    Checkpoints are stored in analysis_results under the stage name, keyed by
+    a hash of the stage inputs. A rerun (retry, regeneration or a job resumed
+    after restart) skips every stage whose inputs are unchanged, so a failure
+    in one stage only costs that stage.
+    """
+
+    def __init__(self, db_manager, username, stages):
+        self.db_manager = db_manager
+        self.username = username
+        self.stages = stages
+
+    async def run(self, context):
+        """Run all stages and return context extended with their outputs.
+
+        If a stage fails, the stages still running are cancelled and the
+        failure is raised.
+        """
+        context = dict(context)
+        tasks = {}
+
+        async def run_when_ready(stage):
+            dependencies = [tasks[name] for name in stage.inputs if name in tasks]
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            context[stage.name] = await self.run_stage(stage, context)
+
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.ensure_future(run_when_ready(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return context
+
+    async def run_stage(self, stage, context):
+        stage_input = {name: context[name] for name in stage.inputs}
+        key = json.dumps(stage_input, sort_keys=True)
+        if stage.version is not None:
+            key = f"{await stage.version()}\n{key}"
+        input_hash = hash_input(key)
+
+        stored = await self.db_manager.get_analysis_results(
+            self.username, {stage.name: input_hash}
+        )
+        if stage.name in stored:
+            output = stored[stage.name]
+            if stage.is_valid is None or stage.is_valid(output):
+                logger.info(
+                    f"Using checkpoint of stage {stage.name} for {self.username}"
+                )
+                return output
+            logger.info(f"Checkpoint of stage {stage.name} is stale, rerunning")
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                logger.debug(
+                    f"Running stage {stage.name} for {self.username} "
+                    f"(attempt {attempt}/{stage.retries + 1})"
+                )
+                output = await stage.run(**stage_input)
+                break
+            except Exception as e:
+                logger.error(
+                    f"Stage {stage.name} failed for {self.username}: {str(e)}",
+                    exc_info=True,
+                )
+                if attempt > stage.retries or not isinstance(e, stage.retry_on):
+                    raise StageFailed(stage.name, e) from e
+                delay = stage.retry_delay * 2 ** (attempt - 1)
+                logger.info(f"Retrying stage {stage.name} in {delay} seconds")
+                await asyncio.sleep(delay)
+
+        await self.db_manager.save_analysis_result(
+            self.username, stage.name, input_hash, output
+        )
+        logger.info(f"Stage {stage.name} completed for {self.username}")
+        return output
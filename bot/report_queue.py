@@ -0,0 +1,178 @@
+import asyncio
+
+from config.logger_config import logger
+
+logger = logger.getChild("report_queue")
+
+
+class ReportJobQueue:
+    """Durable full-report job queue backed by the report_jobs table.
+
+    Handlers enqueue a job and return immediately; a bounded pool of worker
+    tasks claims jobs with FOR UPDATE SKIP LOCKED, so several bot processes can
+    share the table. Failed jobs are retried with exponential backoff. A
+    running job's lock is refreshed every heartbeat_interval seconds, and jobs
+    whose lock has not been refreshed for stale_after seconds (left by a
+    crashed or redeployed process) are periodically put back in the queue.
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        workers=2,
+        max_attempts=3,
+        retry_delay=30,
+        poll_interval=5,
+        stale_after=900,
+        heartbeat_interval=None,
+    ):
+        self.db_manager = db_manager
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval or stale_after / 3
+        self.handler = None
+        self.failure_handler = None
+        self.bot = None
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def set_handler(self, handler, failure_handler=None):
+        """Register the coroutines that run a job and report a final failure.
+
+        Both are called as handler(bot, job) where job has username and chat_id.
+        """
+        self.handler = handler
+        self.failure_handler = failure_handler
+
+    async def enqueue(self, username, chat_id, only_once=False):
+        """Queue a report for the user. Returns False if one is already pending.
+
+        With only_once, nothing is queued if the user ever had a report job.
+        """
+        created = await self.db_manager.enqueue_report_job(username, chat_id, only_once)
+        if created:
+            logger.info(f"Queued full report job for user {username}")
+            self.notify()
+        else:
+            logger.info(f"Full report job not queued again for user {username}")
+        return created
+
+    def notify(self):
+        """Wake idle workers, e.g. after a job was inserted outside enqueue()."""
+        self._wakeup.set()
+
+    async def start(self, bot):
+        if self.handler is None:
+            raise RuntimeError("ReportJobQueue.start() called before set_handler()")
+        self.bot = bot
+        await self._sweep_stale_jobs()
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"report-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(
+            asyncio.create_task(self._requeue_stale_jobs(), name="report-requeue")
+        )
+        logger.info(f"Started {self.workers} report workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Report workers stopped")
+
+    async def _worker(self, worker_id):
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self.db_manager.claim_report_job()
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed to claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(worker_id, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed to update job: {str(e)}")
+
+    async def _requeue_stale_jobs(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._sweep_stale_jobs()
+            except Exception as e:
+                logger.error(f"Failed to requeue stale report jobs: {str(e)}")
+
+    async def _sweep_stale_jobs(self):
+        resumed, failed = await self.db_manager.requeue_stale_report_jobs(
+            self.stale_after, self.max_attempts
+        )
+        if resumed:
+            logger.info(f"Requeued {resumed} stale report jobs")
+            self.notify()
+        for job in failed:
+            await self._notify_failure(job)
+
+    async def _notify_failure(self, job):
+        if self.failure_handler is None:
+            return
+        try:
+            await self.failure_handler(self.bot, job)
+        except Exception as e:
+            logger.error(f"Failure handler for job {job['id']}: {e}")
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.db_manager.heartbeat_report_job(job_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat of report job {job_id} failed: {str(e)}")
+
+    async def _run_handler(self, job):
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            await self.handler(self.bot, job)
+        finally:
+            heartbeat.cancel()
+
+    async def _process(self, worker_id, job):
+        logger.info(
+            f"Worker {worker_id} running report job {job['id']} for user "
+            f"{job['username']} (attempt {job['attempts']}/{self.max_attempts})"
+        )
+        try:
+            await self._run_handler(job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so it resumes after restart,
+            # without using up one of its attempts
+            await self.db_manager.retry_report_job(
+                job["id"], "Interrupted by shutdown", 0, refund_attempt=True
+            )
+            raise
+        except Exception as e:
+            logger.error(f"Report job {job['id']} failed: {str(e)}", exc_info=True)
+            if job["attempts"] >= self.max_attempts:
+                await self.db_manager.fail_report_job(job["id"], str(e))
+                await self._notify_failure(job)
+                return
+            delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+            logger.info(f"Retrying report job {job['id']} in {delay} seconds")
+            await self.db_manager.retry_report_job(job["id"], str(e), delay)
+            return
+
+        await self.db_manager.complete_report_job(job["id"])
+        logger.info(f"Report job {job['id']} completed")
@@ -0,0 +1,83 @@
+import stripe
+from aiohttp import web
+
+from config.logger_config import logger
+
+logger = logger.getChild("stripe_webhook")
+
+DEFAULT_WEBHOOK_PATH = "/stripe/webhook"
+
+
+class StripeWebhook:
+    """aiohttp endpoint receiving Stripe checkout.session.completed events.
+
+    Each event's signature is verified before anything is trusted. A paid
+    session marks its user as paid and queues the full report right away, in
+    one transaction; recording is idempotent, so Stripe's redeliveries do not
+    queue it twice, and a delivery that failed is completed by the next one.
+
+    construct_event can be replaced (e.g. by a function returning a local
+    event stand-in) to exercise the endpoint without real Stripe signatures.
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        report_queue,
+        webhook_secret,
+        checkout_sessions=None,
+        construct_event=stripe.Webhook.construct_event,
+    ):
+        self.db_manager = db_manager
+        self.report_queue = report_queue
+        self.webhook_secret = webhook_secret
+        self.checkout_sessions = checkout_sessions
+        self.construct_event = construct_event
+
+    def create_app(self, path=DEFAULT_WEBHOOK_PATH):
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+    async def handle(self, request):
+        payload = await request.read()
+        signature = request.headers.get("Stripe-Signature", "")
+        try:
+            event = self.construct_event(payload, signature, self.webhook_secret)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            logger.warning(f"Rejected Stripe webhook: {str(e)}")
+            return web.Response(status=400, text="Invalid payload or signature")
+
+        logger.info(f"Received Stripe event {event['id']} ({event['type']})")
+        if event["type"] == "checkout.session.completed":
+            await self.process_completed_session(event["data"]["object"])
+        return web.json_response({"received": True})
+
+    async def process_completed_session(self, session):
+        username = session.get("client_reference_id")
+        if not username:
+            logger.warning(f"Checkout session {session['id']} has no username")
+            return
+        if session.get("payment_status") != "paid":
+            # Delayed payment methods complete first and are paid later
+            logger.info(f"Checkout session {session['id']} is not paid yet")
+            return
+
+        if self.checkout_sessions is not None:
+            self.checkout_sessions.invalidate(username)
+        chat_id = (session.get("metadata") or {}).get("chat_id")
+        if chat_id is not None:
+            chat_id = int(chat_id)
+        if not await self.db_manager.record_stripe_payment(
+            username, session["id"], chat_id
+        ):
+            logger.info(f"Payment for user {username} was already recorded")
+            return
+
+        if chat_id is None:
+            # Sessions created before chat ids were attached: the report is
+            # queued when the user returns through the payment link
+            logger.warning(f"No chat id for user {username}, report not queued")
+            return
+        logger.info(f"Queued full report job for user {username}")
+        self.report_queue.notify()
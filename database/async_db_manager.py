@@ -0,0 +1,551 @@
+import json
+
+import asyncpg
+
+from config.logger_config import logger
+from database.db_manager import parse_pool_options
+from database.schema import SCHEMA_STATEMENTS
+
+# Configure structured logging
+logger = logger.getChild("async_database_manager")
+
+
+class AsyncDatabaseManager:
+    """Asyncio database backend built on an asyncpg connection pool.
+
+    Exposes the same operations as DatabaseManager as coroutines, so a slow
+    query only suspends the handler that issued it instead of the whole
+    dispatcher. Call connect() once before use and close() on shutdown.
+    """
+
+    def __init__(self, db_url):
+        logger.info("Initializing AsyncDatabaseManager")
+        self.db_url, pool_options = parse_pool_options(db_url)
+        self.pool_min_size = pool_options.get("pool_min_size", 1)
+        self.pool_max_size = pool_options.get("pool_max_size", 10)
+        self.pool_recycle = pool_options.get("pool_recycle", 300)
+        if "pool_pre_ping" in pool_options:
+            # asyncpg notices connections the server closed and replaces them
+            # on acquire, so there is no health check to switch on or off
+            logger.warning("pool_pre_ping has no effect with asyncpg, ignoring it")
+        self.pool = None
+
+    async def connect(self):
+        logger.info(
+            f"Creating asyncpg pool (min={self.pool_min_size}, "
+            f"max={self.pool_max_size}, recycle={self.pool_recycle}s)"
+        )
+        self.pool = await asyncpg.create_pool(
+            self.db_url,
+            min_size=self.pool_min_size,
+            max_size=self.pool_max_size,
+            max_inactive_connection_lifetime=self.pool_recycle,
+        )
+        await self.initialize_db()
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            logger.info("asyncpg pool closed")
+
+    async def initialize_db(self):
+        logger.info("Starting database initialization")
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for statement in SCHEMA_STATEMENTS:
+                    await conn.execute(statement)
+        logger.info("Database tables initialized successfully")
+
+    async def get_current_question(self, username):
+        logger.debug(f"Getting current question for user: {username}")
+        async with self.pool.acquire() as conn:
+            result = await conn.fetchval(
+                "SELECT current_question FROM user_progress WHERE username = $1",
+                username,
+            )
+            if result is None:
+                await conn.execute(
+                    "INSERT INTO user_progress (username, current_question) VALUES ($1, 0)",
+                    username,
+                )
+                logger.info(f"Initialized progress for new user {username}")
+                return 0
+            logger.debug(f"Retrieved current question {result} for user {username}")
+            return result
+
+    async def update_current_question(self, username, question_number):
+        logger.debug(f"Updating question to {question_number} for user {username}")
+        await self.pool.execute(
+            """
+            INSERT INTO user_progress (username, current_question)
+            VALUES ($1, $2)
+            ON CONFLICT (username) DO UPDATE
+            SET current_question = EXCLUDED.current_question
+            """,
+            username,
+            question_number,
+        )
+        logger.info(f"Updated question {question_number} for user {username}")
+
+    async def save_user_response(self, username, question_number, response):
+        logger.debug(
+            f"Saving response for user {username} on question {question_number}"
+        )
+        await self.pool.execute(
+            """
+            INSERT INTO user_responses (username, question_number, response)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (username, question_number) DO UPDATE
+            SET response = EXCLUDED.response
+            """,
+            username,
+            question_number,
+            response,
+        )
+        logger.info(
+            f"Successfully saved response for user {username}, question {question_number}"
+        )
+
+    async def get_all_user_responses(self, username):
+        logger.debug(f"Retrieving all responses for user: {username}")
+        rows = await self.pool.fetch(
+            """
+            SELECT response
+            FROM user_responses
+            WHERE username = $1
+            ORDER BY question_number
+            """,
+            username,
+        )
+        responses = [row["response"] for row in rows]
+        logger.debug(f"Retrieved {len(responses)} responses for user {username}")
+        return responses
+
+    async def save_user_info(self, username, question_number, info):
+        logger.debug(f"Saving user info for {username} on question {question_number}")
+        await self.pool.execute(
+            "INSERT INTO user_info (username, question_number, info) VALUES ($1, $2, $3)",
+            username,
+            question_number,
+            info,
+        )
+        logger.info(
+            f"Successfully saved user info for {username}, question {question_number}"
+        )
+
+    async def get_user_info(self, username, question_number):
+        logger.debug(
+            f"Retrieving user info for {username} up to question {question_number}"
+        )
+        rows = await self.pool.fetch(
+            """
+            SELECT question_number, info
+            FROM user_info
+            WHERE username = $1 AND question_number < $2
+            ORDER BY question_number
+            """,
+            username,
+            question_number,
+        )
+        if not rows:
+            logger.debug(f"No user info found for {username}")
+            return None
+
+        logger.debug(f"Retrieved {len(rows)} info entries for user {username}")
+        return [row["info"] for row in rows]
+
+    async def check_report_sent(self, username):
+        logger.debug(f"Checking if report was sent for user: {username}")
+        row = await self.pool.fetchrow(
+            "SELECT full_report_sent FROM user_reports WHERE username = $1",
+            username,
+        )
+        result = bool(row)
+        logger.debug(f"Report sent status for {username}: {result}")
+        return result
+
+    async def mark_report_sent(self, username):
+        logger.debug(f"Marking report as sent for user: {username}")
+        await self.pool.execute(
+            """
+            INSERT INTO user_reports (username, full_report_sent)
+            VALUES ($1, TRUE)
+            ON CONFLICT (username) DO UPDATE
+            SET full_report_sent = TRUE
+            """,
+            username,
+        )
+        logger.info(f"Successfully marked report as sent for user {username}")
+
+    async def check_payment_status(self, username):
+        """Check if user has paid for the full report"""
+        logger.debug(f"Checking payment status for user: {username}")
+        result = await self.pool.fetchval(
+            "SELECT has_paid FROM user_payments WHERE username = $1", username
+        )
+        status = result if result is not None else False
+        logger.debug(f"Payment status for {username}: {status}")
+        return status
+
+    async def update_payment_status(self, username, status):
+        """Update payment status for user"""
+        logger.debug(f"Updating payment status to {status} for user: {username}")
+        await self.pool.execute(
+            """
+            INSERT INTO user_payments (username, has_paid)
+            VALUES ($1, $2)
+            ON CONFLICT (username) DO UPDATE
+            SET has_paid = EXCLUDED.has_paid
+            """,
+            username,
+            status,
+        )
+        logger.info(
+            f"Successfully updated payment status for user {username} to {status}"
+        )
+
+    async def record_stripe_payment(self, username, session_id, chat_id=None):
+        """Mark the user as paid from a completed checkout session.
+
+        Given chat_id, the full report job is queued in the same transaction,
+        so a delivery that fails halfway leaves nothing behind and Stripe's
+        redelivery does all of it. Returns True only the first time a payment
+        is recorded, so repeated webhook deliveries, or a payment already
+        confirmed, do not trigger another report.
+        """
+        logger.debug(f"Recording Stripe payment {session_id} for user: {username}")
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO user_payments (username, has_paid, stripe_session_id)
+                    VALUES ($1, TRUE, $2)
+                    ON CONFLICT (username) DO UPDATE
+                    SET has_paid = TRUE,
+                        payment_date = CURRENT_TIMESTAMP,
+                        stripe_session_id = EXCLUDED.stripe_session_id
+                    WHERE NOT user_payments.has_paid
+                    RETURNING username
+                    """,
+                    username,
+                    session_id,
+                )
+                if row is not None and chat_id is not None:
+                    await self._insert_report_job(conn, username, chat_id)
+        if row is not None:
+            logger.info(f"Recorded Stripe payment {session_id} for user {username}")
+        return row is not None
+
+    async def mark_mini_report_sent(self, username):
+        logger.debug(f"Marking mini report as sent for user: {username}")
+        await self.pool.execute(
+            """
+            INSERT INTO user_reports (username, mini_report_sent)
+            VALUES ($1, TRUE)
+            ON CONFLICT (username) DO UPDATE
+            SET mini_report_sent = TRUE
+            """,
+            username,
+        )
+        logger.info(f"Successfully marked mini report as sent for user {username}")
+
+    async def check_mini_report_sent(self, username):
+        logger.debug(f"Checking if mini report was sent for user: {username}")
+        row = await self.pool.fetchrow(
+            "SELECT mini_report_sent FROM user_reports WHERE username = $1",
+            username,
+        )
+        result = bool(row)
+        logger.debug(f"Mini report sent status for {username}: {result}")
+        return result
+
+    async def claim_precompute_slot(self, username, daily_limit):
+        """Reserve a speculative full-report computation for the user.
+
+        Returns False when the user already has one or when daily_limit
+        precomputations were started in the last 24 hours.
+        """
+        logger.debug(f"Claiming precompute slot for user: {username}")
+        claimed = await self.pool.fetchval(
+            """
+            INSERT INTO precomputed_reports (username, status)
+            SELECT $1, 'pending'
+            WHERE (
+                SELECT COUNT(*) FROM precomputed_reports
+                WHERE created_at > NOW() - INTERVAL '1 day'
+            ) < $2
+            ON CONFLICT (username) DO NOTHING
+            RETURNING username
+            """,
+            username,
+            daily_limit,
+        )
+        logger.debug(f"Precompute slot for {username} claimed: {bool(claimed)}")
+        return bool(claimed)
+
+    async def save_precomputed_analysis(self, username, analysis_data, version):
+        """Store precomputed analysis with the version of the agents behind it."""
+        logger.debug(f"Saving precomputed analysis for user: {username}")
+        await self.pool.execute(
+            """
+            UPDATE precomputed_reports
+            SET status = 'ready', analysis_data = $2::jsonb, version = $3
+            WHERE username = $1
+            """,
+            username,
+            json.dumps(analysis_data),
+            version,
+        )
+        logger.info(f"Successfully saved precomputed analysis for user {username}")
+
+    async def mark_precompute_failed(self, username):
+        logger.debug(f"Marking precompute as failed for user: {username}")
+        await self.pool.execute(
+            "UPDATE precomputed_reports SET status = 'failed' WHERE username = $1",
+            username,
+        )
+
+    async def get_precomputed_analysis(self, username, version):
+        """Return precomputed analysis, unless it came from another version."""
+        logger.debug(f"Retrieving precomputed analysis for user: {username}")
+        result = await self.pool.fetchval(
+            """
+            SELECT analysis_data FROM precomputed_reports
+            WHERE username = $1 AND status = 'ready' AND version = $2
+            """,
+            username,
+            version,
+        )
+        if result is None:
+            logger.debug(f"No usable precomputed analysis for user {username}")
+            return None
+        return json.loads(result)
+
+    async def enqueue_report_job(self, username, chat_id, only_once=False):
+        """Queue a full report job unless one is already pending for the user.
+
+        With only_once, no job is queued if the user ever had one, whatever
+        its status.
+        """
+        logger.debug(f"Enqueuing report job for user: {username}")
+        async with self.pool.acquire() as conn:
+            return await self._insert_report_job(conn, username, chat_id, only_once)
+
+    @staticmethod
+    async def _insert_report_job(conn, username, chat_id, only_once=False):
+        job_id = await conn.fetchval(
+            """
+            INSERT INTO report_jobs (username, chat_id)
+            SELECT $1, $2
+            WHERE NOT $3 OR NOT EXISTS (
+                SELECT 1 FROM report_jobs WHERE username = $1
+            )
+            ON CONFLICT (username) WHERE status IN ('queued', 'running')
+            DO NOTHING
+            RETURNING id
+            """,
+            username,
+            chat_id,
+            only_once,
+        )
+        return job_id is not None
+
+    async def claim_report_job(self):
+        """Lock the next due job for this worker and mark it running."""
+        return await self.pool.fetchrow("""
+            UPDATE report_jobs
+            SET status = 'running', locked_at = NOW(), attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM report_jobs
+                WHERE status = 'queued' AND run_after <= NOW()
+                ORDER BY run_after
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, username, chat_id, attempts
+            """)
+
+    async def complete_report_job(self, job_id):
+        await self.pool.execute(
+            "UPDATE report_jobs SET status = 'done', locked_at = NULL WHERE id = $1",
+            job_id,
+        )
+
+    async def retry_report_job(
+        self, job_id, error, delay_seconds, refund_attempt=False
+    ):
+        """Put a job back in the queue.
+
+        With refund_attempt the claim does not count as an attempt, e.g. when
+        the job was only interrupted by a shutdown.
+        """
+        await self.pool.execute(
+            """
+            UPDATE report_jobs
+            SET status = 'queued', locked_at = NULL, last_error = $2,
+                run_after = NOW() + make_interval(secs => $3),
+                attempts = attempts - CASE WHEN $4 THEN 1 ELSE 0 END
+            WHERE id = $1
+            """,
+            job_id,
+            error,
+            float(delay_seconds),
+            refund_attempt,
+        )
+
+    async def fail_report_job(self, job_id, error):
+        await self.pool.execute(
+            """
+            UPDATE report_jobs
+            SET status = 'failed', locked_at = NULL, last_error = $2
+            WHERE id = $1
+            """,
+            job_id,
+            error,
+        )
+        logger.warning(f"Report job {job_id} failed permanently: {error}")
+
+    async def heartbeat_report_job(self, job_id):
+        """Refresh a running job's lock so it is not taken for stale."""
+        await self.pool.execute(
+            """
+            UPDATE report_jobs SET locked_at = NOW()
+            WHERE id = $1 AND status = 'running'
+            """,
+            job_id,
+        )
+
+    async def requeue_stale_report_jobs(self, stale_after_seconds, max_attempts):
+        """Put jobs whose worker died mid-run back in the queue.
+
+        Jobs that have already used max_attempts are marked failed instead,
+        so a job that keeps killing its worker does not run forever.
+
+        Returns:
+            tuple: Number of requeued jobs and the records of failed jobs
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                failed = await conn.fetch(
+                    """
+                    UPDATE report_jobs
+                    SET status = 'failed', locked_at = NULL,
+                        last_error = 'Worker stopped while running the job'
+                    WHERE status = 'running'
+                    AND locked_at < NOW() - make_interval(secs => $1)
+                    AND attempts >= $2
+                    RETURNING id, username, chat_id, attempts
+                    """,
+                    float(stale_after_seconds),
+                    max_attempts,
+                )
+                result = await conn.execute(
+                    """
+                    UPDATE report_jobs
+                    SET status = 'queued', locked_at = NULL
+                    WHERE status = 'running'
+                    AND locked_at < NOW() - make_interval(secs => $1)
+                    """,
+                    float(stale_after_seconds),
+                )
+        for job in failed:
+            logger.warning(f"Report job {job['id']} failed permanently: worker died")
+        return int(result.split()[-1]), failed
+
+    async def get_analysis_results(self, username, input_hashes):
+        """Return stored agent results matching the given inputs.
+
+        Args:
+            username (str): Telegram username
+            input_hashes (dict): Agent name mapped to the hash of its input
+
+        Returns:
+            dict: Agent name mapped to its parsed result, for agents with a
+            stored result for exactly that input
+        """
+        logger.debug(f"Retrieving analysis results for user: {username}")
+        rows = await self.pool.fetch(
+            """
+            SELECT agent, result FROM analysis_results
+            WHERE username = $1 AND (agent, input_hash) IN (
+                SELECT * FROM unnest($2::text[], $3::text[])
+            )
+            """,
+            username,
+            list(input_hashes.keys()),
+            list(input_hashes.values()),
+        )
+        logger.debug(f"Retrieved {len(rows)} analysis results for user {username}")
+        return {row["agent"]: json.loads(row["result"]) for row in rows}
+
+    async def save_analysis_result(self, username, agent, input_hash, result):
+        logger.debug(f"Saving {agent} analysis result for user: {username}")
+        await self.pool.execute(
+            """
+            INSERT INTO analysis_results (username, agent, input_hash, result)
+            VALUES ($1, $2, $3, $4::jsonb)
+            ON CONFLICT (username, agent, input_hash) DO UPDATE
+            SET result = EXCLUDED.result, created_at = CURRENT_TIMESTAMP
+            """,
+            username,
+            agent,
+            input_hash,
+            json.dumps(result),
+        )
+        logger.info(f"Successfully saved {agent} analysis result for user {username}")
+
+    async def get_cached_response(self, cache_key):
+        return await self.pool.fetchval(
+            """
+            SELECT response FROM llm_response_cache
+            WHERE cache_key = $1 AND expires_at > NOW()
+            """,
+            cache_key,
+        )
+
+    async def save_cached_response(self, cache_key, response, ttl_seconds):
+        await self.pool.execute(
+            """
+            INSERT INTO llm_response_cache (cache_key, response, expires_at)
+            VALUES ($1, $2, NOW() + make_interval(secs => $3))
+            ON CONFLICT (cache_key) DO UPDATE
+            SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at
+            """,
+            cache_key,
+            response,
+            float(ttl_seconds),
+        )
+
+    async def delete_cached_response(self, cache_key):
+        await self.pool.execute(
+            "DELETE FROM llm_response_cache WHERE cache_key = $1", cache_key
+        )
+
+    async def purge_expired_cached_responses(self):
+        result = await self.pool.execute(
+            "DELETE FROM llm_response_cache WHERE expires_at <= NOW()"
+        )
+        return int(result.split()[-1])
+
+    async def get_gemini_upload(self, blob_key):
+        row = await self.pool.fetchval(
+            """
+            SELECT file FROM gemini_uploads
+            WHERE blob_key = $1 AND expires_at > NOW()
+            """,
+            blob_key,
+        )
+        return json.loads(row) if row is not None else None
+
+    async def save_gemini_upload(self, blob_key, file, ttl_seconds):
+        await self.pool.execute(
+            """
+            INSERT INTO gemini_uploads (blob_key, file, expires_at)
+            VALUES ($1, $2::jsonb, NOW() + make_interval(secs => $3))
+            ON CONFLICT (blob_key) DO UPDATE
+            SET file = EXCLUDED.file, expires_at = EXCLUDED.expires_at
+            """,
+            blob_key,
+            json.dumps(file),
+            float(ttl_seconds),
+        )
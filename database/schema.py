@@ -0,0 +1,97 @@
+"""Table definitions shared by the sync and async database managers."""
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS user_progress (
+        username TEXT PRIMARY KEY,
+        current_question INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_responses (
+        username TEXT,
+        question_number INTEGER,
+        response TEXT,
+        PRIMARY KEY (username, question_number)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_reports (
+        username TEXT PRIMARY KEY,
+        mini_report_sent BOOLEAN DEFAULT FALSE,
+        full_report_sent BOOLEAN DEFAULT FALSE,
+        report_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_info (
+        username TEXT,
+        question_number INTEGER,
+        info TEXT,
+        PRIMARY KEY (username, question_number)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_payments (
+        username TEXT PRIMARY KEY,
+        has_paid BOOLEAN DEFAULT FALSE,
+        payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    ALTER TABLE user_payments ADD COLUMN IF NOT EXISTS stripe_session_id TEXT
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS precomputed_reports (
+        username TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pending',
+        analysis_data JSONB,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    ALTER TABLE precomputed_reports ADD COLUMN IF NOT EXISTS version TEXT
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        id SERIAL PRIMARY KEY,
+        username TEXT NOT NULL,
+        chat_id BIGINT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        locked_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS report_jobs_pending_username
+    ON report_jobs (username) WHERE status IN ('queued', 'running')
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analysis_results (
+        username TEXT,
+        agent TEXT,
+        input_hash TEXT,
+        result JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (username, agent, input_hash)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS llm_response_cache (
+        cache_key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS gemini_uploads (
+        -- "sha256:<hex>" of the uploaded audio
+        blob_key TEXT PRIMARY KEY,
+        file JSONB NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,
+]
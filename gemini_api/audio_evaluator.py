@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import google.generativeai as genai
+
+from config.logger_config import logger
+from resilience.rate_limit import rate_limits
+from resilience.retry import DEFAULT_ATTEMPTS, retry_call
+
+logger = logger.getChild("audio_evaluator")
+
+# Gemini deletes uploaded files after 48 hours; reuse uploads an hour less
+GEMINI_FILE_TTL = 47 * 60 * 60
+
+AUDIO_MIME_TYPE = "audio/ogg"
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as blob:
+        for chunk in iter(lambda: blob.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_audio_file(path):
+    """Upload an audio file to Gemini and return its file reference."""
+    audio_file = genai.upload_file(path, mime_type=AUDIO_MIME_TYPE)
+    logger.debug(f"Uploaded audio file: {audio_file}")
+    return {
+        "name": audio_file.name,
+        "uri": audio_file.uri,
+        "mime_type": audio_file.mime_type,
+        "uploaded_at": time.time(),
+    }
+
+
+class AudioEvaluator:
+    """Evaluates voice answers with a Gemini model.
+
+    Clips of at most inline_max_bytes are sent inside the request as inline
+    bytes; larger ones go through the File API, with uploads cached in the
+    gemini_uploads table by content hash. Latency and payload size are kept
+    per path so the two can be compared. Uploads and generation follow the
+    same timeout and retry policy as the OpenAI agents.
+    """
+
+    def __init__(
+        self,
+        model,
+        db_manager,
+        inline_max_bytes=0,
+        limits=rate_limits,
+        timeout=None,
+        max_retries=DEFAULT_ATTEMPTS,
+    ):
+        self.model = model
+        self.db_manager = db_manager
+        self.inline_max_bytes = inline_max_bytes
+        self.limits = limits
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.path_stats = {}
+
+    async def get_instructions_version(self):
+        """Hash of the model configuration, so edits invalidate stored results."""
+        config = "\n".join(
+            str(getattr(self.model, attribute, ""))
+            for attribute in ("model_name", "_system_instruction", "_generation_config")
+        )
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+
+    def record(self, path, latency, payload_bytes):
+        totals = self.path_stats.setdefault(
+            path, {"count": 0, "latency": 0.0, "payload_bytes": 0}
+        )
+        totals["count"] += 1
+        totals["latency"] += latency
+        totals["payload_bytes"] += payload_bytes
+
+    def stats(self):
+        return {
+            path: {
+                "count": totals["count"],
+                "average_latency": totals["latency"] / totals["count"],
+                "average_payload_bytes": totals["payload_bytes"] / totals["count"],
+            }
+            for path, totals in self.path_stats.items()
+        }
+
+    async def get_uploaded(self, path):
+        """Return the Gemini file for path, uploading it unless a live one is cached.
+
+        Uploads are keyed by content hash, so retries, regenerations and
+        repeated copies of the same clip reuse one upload until Gemini
+        expires it.
+        """
+        blob_key = f"sha256:{await asyncio.to_thread(hash_file, path)}"
+        uploaded = await self.db_manager.get_gemini_upload(blob_key)
+        if uploaded is not None:
+            logger.debug(f"Reusing Gemini upload {uploaded['name']} for {path}")
+            return uploaded
+        start = time.monotonic()
+        uploaded = await retry_call(
+            lambda: self.upload(path),
+            attempts=self.max_retries,
+            timeout=self.timeout,
+            name=f"Gemini upload of {path}",
+        )
+        self.record("file_upload", time.monotonic() - start, os.path.getsize(path))
+        await self.db_manager.save_gemini_upload(blob_key, uploaded, GEMINI_FILE_TTL)
+        return uploaded
+
+    async def upload(self, path):
+        # The SDK has no async upload; the thread keeps the loop free
+        async with self.limits.guard("gemini", "files"):
+            return await asyncio.to_thread(upload_audio_file, path)
+
+    def is_inline(self, path):
+        """Whether the clip is small enough to be sent inside the request."""
+        return os.path.getsize(path) <= self.inline_max_bytes
+
+    async def prepare(self, paths):
+        """Make the clips available to the model: inline or uploaded.
+
+        Returns JSON-serializable references; inline clips are referenced by
+        their local path and only read when the request is built.
+        """
+
+        async def prepare_file(path):
+            if self.is_inline(path):
+                return {"path": path, "mime_type": AUDIO_MIME_TYPE}
+            return await self.get_uploaded(path)
+
+        files = await asyncio.gather(*(prepare_file(path) for path in paths))
+        uploaded_at = [f["uploaded_at"] for f in files if "uploaded_at" in f]
+        return {"files": files, "uploaded_at": min(uploaded_at, default=time.time())}
+
+    @staticmethod
+    def is_usable(prepared):
+        """Whether prepared references can still be sent to the model."""
+        return time.time() - prepared["uploaded_at"] < GEMINI_FILE_TTL and all(
+            os.path.exists(f["path"]) for f in prepared["files"] if "path" in f
+        )
+
+    def build_parts(self, questions, files):
+        parts = []
+        inline_bytes = 0
+        for question, audio_file in zip(questions, files):
+            parts.append(f"{question}:")
+            if "path" in audio_file:
+                with open(audio_file["path"], "rb") as blob:
+                    data = blob.read()
+                inline_bytes += len(data)
+                parts.append({"mime_type": audio_file["mime_type"], "data": data})
+            else:
+                parts.append(
+                    {
+                        "file_data": {
+                            "mime_type": audio_file["mime_type"],
+                            "file_uri": audio_file["uri"],
+                        }
+                    }
+                )
+        return parts, inline_bytes
+
+    async def generate(self, parts):
+        async with self.limits.guard("gemini", self.model.model_name):
+            return await self.model.generate_content_async(parts)
+
+    async def evaluate(self, questions, prepared):
+        """Ask the model to evaluate each answer and return its raw text."""
+        files = prepared["files"]
+        parts, inline_bytes = await asyncio.to_thread(
+            self.build_parts, questions, files
+        )
+        inline_count = sum("path" in f for f in files)
+        if inline_count == len(files):
+            path = "inline"
+        elif inline_count == 0:
+            path = "file_api"
+        else:
+            path = "mixed"
+
+        start = time.monotonic()
+        response = await retry_call(
+            lambda: self.generate(parts),
+            attempts=self.max_retries,
+            timeout=self.timeout,
+            name=f"Gemini evaluation with {self.model.model_name}",
+        )
+        latency = time.monotonic() - start
+        self.record(path, latency, inline_bytes)
+        logger.info(
+            f"Audio evaluation ({path}) took {latency:.2f}s with {inline_bytes} "
+            f"inline bytes; per path: {self.stats()}"
+        )
+        return response.text
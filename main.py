@@ -1,16 +1,28 @@
 import asyncio
 import os
 import google.generativeai as genai
+import httpx
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiohttp import web
 from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
-from bot.handlers import setup_router
-from database.db_manager import DatabaseManager
+from bot.handlers import audio_downloader, checkout_sessions, setup_router
+from bot.report_queue import ReportJobQueue
+from bot.stripe_webhook import DEFAULT_WEBHOOK_PATH, StripeWebhook
+from config.logger_config import logger
+from database.async_db_manager import AsyncDatabaseManager
+from gemini_api.audio_evaluator import AudioEvaluator
 from gemini_system_prompt import GEMINI_SYSTEM_INSTRUCTION
-from openai_api.assistant_manager import AssistantManager
+from openai_api.assistant_manager import AsyncAssistantManager
+from openai_api.assistant_snapshot import AssistantSnapshotStore
+from openai_api.combined_analysis import CombinedAnalysisManager
+from openai_api.response_cache import ResponseCache
+from openai_api.schemas import CombinedAnalysis, RubricAnalysis, StudyPlan
+from resilience.rate_limit import rate_limits
 
 if os.path.exists(".env"):
     load_dotenv()
@@ -33,28 +45,200 @@ AUDIO_AGENT_ID = os.getenv("AUDIO_AGENT_ID")
 MINI_REPORT_AGENT_ID = os.getenv("MINI_REPORT_AGENT_ID")
 STUDY_PLAN_AGENT_ID = os.getenv("STUDY_PLAN_AGENT_ID")
 
+# Per-agent backend: "assistants" (threads and runs) or "chat" (one completion)
+VOCABULARY_AGENT_BACKEND = os.getenv("VOCABULARY_AGENT_BACKEND", "assistants")
+TENSE_AGENT_BACKEND = os.getenv("TENSE_AGENT_BACKEND", "assistants")
+STYLE_AGENT_BACKEND = os.getenv("STYLE_AGENT_BACKEND", "assistants")
+GRAMMAR_AGENT_BACKEND = os.getenv("GRAMMAR_AGENT_BACKEND", "assistants")
+MINI_REPORT_AGENT_BACKEND = os.getenv("MINI_REPORT_AGENT_BACKEND", "assistants")
+STUDY_PLAN_AGENT_BACKEND = os.getenv("STUDY_PLAN_AGENT_BACKEND", "assistants")
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_LIVE_SECRET_KEY")
 
+# Stripe webhook: set the signing secret to confirm payments via
+# checkout.session.completed events instead of the success deep link
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+STRIPE_WEBHOOK_PATH = os.getenv("STRIPE_WEBHOOK_PATH", DEFAULT_WEBHOOK_PATH)
+
+# Maximum number of analysis agents running at once for a single report
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "5"))
+
+# Opt-in: start the full report analysis before payment, bounded per 24 hours
+PRECOMPUTE_FULL_REPORT = os.getenv("PRECOMPUTE_FULL_REPORT", "false").lower() == "true"
+PRECOMPUTE_DAILY_LIMIT = int(os.getenv("PRECOMPUTE_DAILY_LIMIT", "50"))
+
+# Full report job queue
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_MAX_ATTEMPTS = int(os.getenv("REPORT_MAX_ATTEMPTS", "3"))
+REPORT_RETRY_DELAY = int(os.getenv("REPORT_RETRY_DELAY", "30"))
+REPORT_JOB_STALE_AFTER = int(os.getenv("REPORT_JOB_STALE_AFTER", "900"))
+
+# Agent response cache
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_PERSISTENT = os.getenv("LLM_CACHE_PERSISTENT", "false").lower() == "true"
+
+# How assistant runs are awaited: "stream" (run events) or "poll"
+ASSISTANT_RUN_MODE = os.getenv("ASSISTANT_RUN_MODE", "stream")
+
+# Where assistant metadata is cached between restarts
+ASSISTANT_SNAPSHOT_PATH = os.getenv(
+    "ASSISTANT_SNAPSHOT_PATH", "assistant_snapshot.json"
+)
+
+# Connection pool size of the shared OpenAI client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+# Ask agents for strict JSON schema outputs instead of tagged text
+STRUCTURED_OUTPUTS = os.getenv("STRUCTURED_OUTPUTS", "true").lower() == "true"
+
+# Fetch voice answers into the local store as they arrive, and optionally
+# upload them to Gemini right away too
+AUDIO_EAGER_INGEST = os.getenv("AUDIO_EAGER_INGEST", "true").lower() == "true"
+AUDIO_PREUPLOAD = os.getenv("AUDIO_PREUPLOAD", "false").lower() == "true"
+
+# Voice answers up to this size are sent inline with the Gemini request
+# instead of through the File API (0 always uses the File API)
+AUDIO_INLINE_MAX_BYTES = int(os.getenv("AUDIO_INLINE_MAX_BYTES", "0"))
+
+# Text analysis: "separate" (one call per rubric agent) or "combined" (one
+# call covering all four rubrics)
+TEXT_ANALYSIS_MODE = os.getenv("TEXT_ANALYSIS_MODE", "separate")
+if TEXT_ANALYSIS_MODE not in ("separate", "combined"):
+    raise ValueError("TEXT_ANALYSIS_MODE must be 'separate' or 'combined'")
+COMBINED_ANALYSIS_MODEL = os.getenv("COMBINED_ANALYSIS_MODEL")
+
+# Timeout (seconds, 0 for none) and attempts of every OpenAI and Gemini call
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "180")) or None
+AGENT_MAX_RETRIES = int(os.getenv("AGENT_MAX_RETRIES", "5"))
+
+# Process-wide rate limits: requests per second and burst size per model
+OPENAI_RATE_LIMIT = float(os.getenv("OPENAI_RATE_LIMIT", "5"))
+OPENAI_RATE_BURST = int(os.getenv("OPENAI_RATE_BURST", "10"))
+GEMINI_RATE_LIMIT = float(os.getenv("GEMINI_RATE_LIMIT", "2"))
+GEMINI_RATE_BURST = int(os.getenv("GEMINI_RATE_BURST", "4"))
+RATE_LIMIT_MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "100"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))
+RATE_LIMIT_STATS_INTERVAL = int(os.getenv("RATE_LIMIT_STATS_INTERVAL", "300"))
+
+# Circuit breaker: consecutive provider failures before failing fast
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = int(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Hedging: duplicate an agent call once it outlasts this latency percentile
+# (0 disables), hedging at most HEDGE_MAX_RATE of calls
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0"))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Empty threads each Assistants-backed agent keeps pre-created
+ASSISTANT_THREAD_POOL_SIZE = int(os.getenv("ASSISTANT_THREAD_POOL_SIZE", "2"))
+
+# Initialize database manager
+db_manager = AsyncDatabaseManager(DATABASE_URL)
+
+# Shared by all assistants; keys include the assistant id
+response_cache = ResponseCache(
+    max_entries=LLM_CACHE_SIZE,
+    ttl=LLM_CACHE_TTL,
+    db_manager=db_manager if LLM_CACHE_PERSISTENT else None,
+)
+
+# Configure provider limits shared by every agent and the audio model
+for provider, rate, burst in (
+    ("openai", OPENAI_RATE_LIMIT, OPENAI_RATE_BURST),
+    ("gemini", GEMINI_RATE_LIMIT, GEMINI_RATE_BURST),
+):
+    rate_limits.configure(
+        provider,
+        rate=rate,
+        burst=burst,
+        max_queue=RATE_LIMIT_MAX_QUEUE,
+        max_wait=RATE_LIMIT_MAX_WAIT,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    )
+
+# Assistant metadata snapshot, so startup does not wait on assistants.retrieve
+assistant_snapshot_store = AssistantSnapshotStore(ASSISTANT_SNAPSHOT_PATH)
+
+# One client and connection pool shared by all assistant managers
+openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+        )
+    ),
+)
+
+
+def create_assistant_manager(assistant_id, backend, response_model=None):
+    return AsyncAssistantManager(
+        api_key=OPENAI_API_KEY,
+        assistant_id=assistant_id,
+        cache=response_cache,
+        run_mode=ASSISTANT_RUN_MODE,
+        backend=backend,
+        thread_pool_size=ASSISTANT_THREAD_POOL_SIZE,
+        client=openai_client,
+        snapshot_store=assistant_snapshot_store,
+        hedge_percentile=HEDGE_PERCENTILE,
+        hedge_max_rate=HEDGE_MAX_RATE,
+        hedge_min_samples=HEDGE_MIN_SAMPLES,
+        response_model=response_model if STRUCTURED_OUTPUTS else None,
+        timeout=AGENT_TIMEOUT,
+        max_retries=AGENT_MAX_RETRIES,
+    )
+
+
 # Initialize assistant managers
-vocabulary_assistant_manager = AssistantManager(
-    api_key=OPENAI_API_KEY, assistant_id=VOCABULARY_AGENT_ID
+vocabulary_assistant_manager = create_assistant_manager(
+    VOCABULARY_AGENT_ID, VOCABULARY_AGENT_BACKEND, RubricAnalysis
+)
+tense_assistant_manager = create_assistant_manager(
+    TENSE_AGENT_ID, TENSE_AGENT_BACKEND, RubricAnalysis
 )
-tense_assistant_manager = AssistantManager(
-    api_key=OPENAI_API_KEY, assistant_id=TENSE_AGENT_ID
+style_assistant_manager = create_assistant_manager(
+    STYLE_AGENT_ID, STYLE_AGENT_BACKEND, RubricAnalysis
 )
-style_assistant_manager = AssistantManager(
-    api_key=OPENAI_API_KEY, assistant_id=STYLE_AGENT_ID
+grammar_assistant_manager = create_assistant_manager(
+    GRAMMAR_AGENT_ID, GRAMMAR_AGENT_BACKEND, RubricAnalysis
 )
-grammar_assistant_manager = AssistantManager(
-    api_key=OPENAI_API_KEY, assistant_id=GRAMMAR_AGENT_ID
+mini_report_assistant_manager = create_assistant_manager(
+    MINI_REPORT_AGENT_ID, MINI_REPORT_AGENT_BACKEND
 )
-mini_report_assistant_manager = AssistantManager(
-    api_key=OPENAI_API_KEY, assistant_id=MINI_REPORT_AGENT_ID
+study_plan_assistant_manager = create_assistant_manager(
+    STUDY_PLAN_AGENT_ID, STUDY_PLAN_AGENT_BACKEND, StudyPlan
 )
-study_plan_assistant_manager = AssistantManager(
-    api_key=OPENAI_API_KEY, assistant_id=STUDY_PLAN_AGENT_ID
+combined_analysis_manager = None
+if TEXT_ANALYSIS_MODE == "combined":
+    combined_analysis_manager = CombinedAnalysisManager(
+        openai_client,
+        {
+            "vocabulary": vocabulary_assistant_manager,
+            "tense": tense_assistant_manager,
+            "style": style_assistant_manager,
+            "grammar": grammar_assistant_manager,
+        },
+        cache=response_cache,
+        model=COMBINED_ANALYSIS_MODEL,
+        response_model=CombinedAnalysis if STRUCTURED_OUTPUTS else None,
+        timeout=AGENT_TIMEOUT,
+        max_retries=AGENT_MAX_RETRIES,
+    )
+assistant_managers = (
+    vocabulary_assistant_manager,
+    tense_assistant_manager,
+    style_assistant_manager,
+    grammar_assistant_manager,
+    mini_report_assistant_manager,
+    study_plan_assistant_manager,
 )
 
 genai.configure(api_key=os.environ["GEMINI_API_KEY"])
@@ -70,17 +254,61 @@ audio_model_genai = genai.GenerativeModel(
     },
     system_instruction=GEMINI_SYSTEM_INSTRUCTION,
 )
+audio_evaluator = AudioEvaluator(
+    audio_model_genai,
+    db_manager,
+    inline_max_bytes=AUDIO_INLINE_MAX_BYTES,
+    timeout=AGENT_TIMEOUT,
+    max_retries=AGENT_MAX_RETRIES,
+)
 
-# Initialize database manager
-db_manager = DatabaseManager(DATABASE_URL)
+# Initialize full report job queue
+report_queue = ReportJobQueue(
+    db_manager,
+    workers=REPORT_WORKERS,
+    max_attempts=REPORT_MAX_ATTEMPTS,
+    retry_delay=REPORT_RETRY_DELAY,
+    stale_after=REPORT_JOB_STALE_AFTER,
+)
 
 # Create and configure the bot
 bot = Bot(token=tg_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 
 
+async def warm_up_assistants():
+    results = await asyncio.gather(
+        *(manager.warm_up() for manager in assistant_managers),
+        return_exceptions=True,
+    )
+    for manager, result in zip(assistant_managers, results):
+        if isinstance(result, Exception):
+            logger.warning(
+                f"Failed to warm up assistant {manager.assistant_id}: {str(result)}"
+            )
+
+
+async def log_call_stats():
+    while True:
+        await asyncio.sleep(RATE_LIMIT_STATS_INTERVAL)
+        for name, stats in rate_limits.stats().items():
+            logger.info(f"Rate limiter {name}: {stats}")
+        if HEDGE_PERCENTILE:
+            for manager in assistant_managers:
+                logger.info(
+                    f"Hedging for {manager.assistant_id}: {manager.hedge_stats()}"
+                )
+
+
 async def main() -> None:
+    warm_up_task = None
+    stats_task = None
+    webhook_runner = None
     try:
+        await db_manager.connect()
+        if LLM_CACHE_PERSISTENT:
+            await db_manager.purge_expired_cached_responses()
+
         # Get bot username
         bot_username = (await bot.get_me()).username
 
@@ -90,19 +318,58 @@ async def main() -> None:
             tense_assistant_manager,
             style_assistant_manager,
             grammar_assistant_manager,
-            audio_model_genai,
+            audio_evaluator,
             mini_report_assistant_manager,
             study_plan_assistant_manager,
             db_manager,
             tg_bot_token,
             bot_username,
             STRIPE_SECRET_KEY,
+            report_queue,
+            ANALYSIS_CONCURRENCY,
+            PRECOMPUTE_FULL_REPORT,
+            PRECOMPUTE_DAILY_LIMIT,
+            combined_analysis_manager,
+            AUDIO_EAGER_INGEST,
+            AUDIO_PREUPLOAD,
+            bool(STRIPE_WEBHOOK_SECRET),
         )
         dp.include_router(router)
+        # Resolve assistants concurrently without delaying startup
+        warm_up_task = asyncio.create_task(warm_up_assistants())
+        if RATE_LIMIT_STATS_INTERVAL > 0:
+            stats_task = asyncio.create_task(log_call_stats())
+        await report_queue.start(bot)
+        if STRIPE_WEBHOOK_SECRET:
+            stripe_webhook = StripeWebhook(
+                db_manager,
+                report_queue,
+                STRIPE_WEBHOOK_SECRET,
+                checkout_sessions=checkout_sessions,
+            )
+            webhook_runner = web.AppRunner(
+                stripe_webhook.create_app(STRIPE_WEBHOOK_PATH)
+            )
+            await webhook_runner.setup()
+            await web.TCPSite(webhook_runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            logger.info(
+                f"Stripe webhook listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}"
+                f"{STRIPE_WEBHOOK_PATH}"
+            )
 
         await dp.start_polling(bot, timeout=20, relax=0.1)
     except Exception as e:
         raise
+    finally:
+        for task in (warm_up_task, stats_task):
+            if task is not None:
+                task.cancel()
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        await report_queue.stop()
+        await db_manager.close()
+        await openai_client.close()
+        await audio_downloader.close()
 
 
 if __name__ == "__main__":
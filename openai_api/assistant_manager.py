@@ -1,11 +1,64 @@
+import asyncio
+import hashlib
+import math
+import random
 import time
 import logging
+from collections import deque
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from openai.types.beta import Assistant
+
+from openai_api.schemas import response_format
+from openai_api.usage import record_usage
+from resilience.rate_limit import rate_limits
+from resilience.retry import DEFAULT_ATTEMPTS, retry_call
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# "stream" waits on run events, "poll" uses adaptive polling
+RUN_MODES = ("stream", "poll")
+POLL_MIN_INTERVAL = 0.05
+POLL_MAX_INTERVAL = 1.0
+POLL_BACKOFF = 1.5
+
+# Seconds a retry waits for the timed-out run on its thread to be cancelled;
+# the API rejects a new run while the thread still has an active one
+RUN_CANCEL_TIMEOUT = 10
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
+
+# HTTP status equivalent of a failed run's last_error code, for the circuit
+# breaker; other codes (e.g. invalid_prompt) say nothing about provider health
+RUN_ERROR_STATUS = {"rate_limit_exceeded": 429, "server_error": 500}
+
+# Latency samples kept per agent for hedging decisions
+HEDGE_WINDOW = 200
+
+# "assistants" uses threads and runs, "chat" sends one chat completion
+BACKENDS = ("assistants", "chat")
+
+
+class RunFailedError(Exception):
+    """Raised for an Assistants API run that ended with status "failed".
+
+    Carries the HTTP status equivalent of the run's error as status_code, so
+    rate-limited and server-failed runs count as provider failures.
+    """
+
+    def __init__(self, thread_id, last_error):
+        self.code = last_error.code if last_error else None
+        self.status_code = RUN_ERROR_STATUS.get(self.code)
+        message = last_error.message if last_error else "unknown error"
+        super().__init__(f"Run failed in thread {thread_id}: {message}")
+
+
+def check_run(run, thread_id):
+    """Raise RunFailedError if run failed, otherwise return it."""
+    if run.status == "failed":
+        raise RunFailedError(thread_id, run.last_error)
+    return run
+
 
 class AssistantManager:
     def __init__(self, api_key, assistant_id):
@@ -91,3 +144,419 @@ class AssistantManager:
         answer = self.get_answer(thread.id)
         logger.info("Message handling completed")
         return answer
+
+
+class AsyncAssistantManager:
+    """Asyncio counterpart of AssistantManager built on AsyncOpenAI.
+
+    All network calls are awaited and run polling uses asyncio.sleep, so
+    generating a report does not block the aiogram event loop.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        assistant_id,
+        cache=None,
+        run_mode="stream",
+        backend="assistants",
+        thread_pool_size=0,
+        client=None,
+        snapshot_store=None,
+        limits=rate_limits,
+        hedge_percentile=None,
+        hedge_max_rate=0.1,
+        hedge_min_samples=20,
+        response_model=None,
+        timeout=None,
+        max_retries=DEFAULT_ATTEMPTS,
+    ):
+        logger.info(
+            f"Initializing AsyncAssistantManager with assistant_id: {assistant_id}"
+        )
+        if run_mode not in RUN_MODES:
+            raise ValueError(f"run_mode must be one of {RUN_MODES}, got {run_mode}")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}, got {backend}")
+        # Pass a shared client so all agents use one connection pool
+        self.client = client or AsyncOpenAI(api_key=api_key)
+        self.assistant_id = assistant_id
+        self.assistant = None
+        self.snapshot_store = snapshot_store
+        self._assistant_lock = asyncio.Lock()
+        self._snapshot_refresh_task = None
+        self.cache = cache
+        self.limits = limits
+        # Pydantic model the answer must match, enforced as a strict JSON schema
+        self.response_model = response_model
+        # Per-attempt timeout and attempts of every model call
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.run_mode = run_mode
+        self.backend = backend
+        # Empty threads created ahead of time, used once each
+        self.thread_pool_size = thread_pool_size if backend == "assistants" else 0
+        self.thread_pool = deque()
+        self.thread_pool_hits = 0
+        self.thread_pool_misses = 0
+        self.threads_prewarmed = 0
+        self._refill_task = None
+        # A duplicate call is started once a call outlasts this latency
+        # percentile; at most hedge_max_rate of calls are hedged
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_rate = hedge_max_rate
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = deque(maxlen=HEDGE_WINDOW)
+        self.hedge_calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # Server-side cancellations of interrupted runs, by thread id
+        self._run_cancellations = {}
+
+    async def get_assistant(self):
+        """Resolve assistant metadata lazily, on first use.
+
+        A local snapshot is used right away when available, and the live
+        metadata is refreshed in the background.
+        """
+        if self.assistant is not None:
+            return self.assistant
+        async with self._assistant_lock:
+            if self.assistant is not None:
+                return self.assistant
+            snapshot = None
+            if self.snapshot_store is not None:
+                snapshot = self.snapshot_store.load(self.assistant_id)
+            if snapshot is None:
+                return await self.refresh_assistant()
+            logger.debug(f"Using snapshot of assistant {self.assistant_id}")
+            self.assistant = Assistant.model_validate(snapshot)
+            self._snapshot_refresh_task = asyncio.create_task(
+                self._refresh_assistant_in_background()
+            )
+            return self.assistant
+
+    async def refresh_assistant(self):
+        logger.debug(f"Retrieving assistant {self.assistant_id}")
+        self.assistant = await self.client.beta.assistants.retrieve(self.assistant_id)
+        if self.snapshot_store is not None:
+            self.snapshot_store.save(
+                self.assistant_id, self.assistant.model_dump(mode="json")
+            )
+        return self.assistant
+
+    async def _refresh_assistant_in_background(self):
+        try:
+            await self.refresh_assistant()
+        except Exception as e:
+            logger.warning(f"Failed to refresh assistant {self.assistant_id}: {str(e)}")
+
+    async def warm_up(self):
+        """Resolve assistant metadata and fill the thread pool ahead of traffic."""
+        self.refill_thread_pool()
+        await self.get_assistant()
+
+    async def get_instructions_version(self):
+        """Hash of the assistant configuration, so edits invalidate the cache."""
+        assistant = await self.get_assistant()
+        config = f"{assistant.model}\n{assistant.instructions}"
+        if self.response_model is not None:
+            config += f"\n{self.response_model.model_json_schema()}"
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+
+    async def get_cache_key(self, responses):
+        return self.cache.make_key(
+            self.assistant_id, await self.get_instructions_version(), responses
+        )
+
+    async def create_thread(self):
+        if self.thread_pool_size:
+            thread = self.thread_pool.popleft() if self.thread_pool else None
+            self.refill_thread_pool()
+            if thread is not None:
+                self.thread_pool_hits += 1
+                logger.debug(f"Using pre-warmed thread {thread.id}")
+                return thread
+            self.thread_pool_misses += 1
+        logger.debug("Creating new thread")
+        return await self.client.beta.threads.create()
+
+    def refill_thread_pool(self):
+        """Top the thread pool up to thread_pool_size in the background."""
+        if not self.thread_pool_size:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill_thread_pool())
+
+    async def _refill_thread_pool(self):
+        while len(self.thread_pool) < self.thread_pool_size:
+            try:
+                thread = await self.client.beta.threads.create()
+            except Exception as e:
+                logger.warning(f"Failed to pre-warm thread: {str(e)}")
+                return
+            self.thread_pool.append(thread)
+            self.threads_prewarmed += 1
+        logger.debug(f"Thread pool refilled ({self.thread_pool_stats()})")
+
+    def thread_pool_stats(self):
+        return {
+            "size": len(self.thread_pool),
+            "hits": self.thread_pool_hits,
+            "misses": self.thread_pool_misses,
+            "prewarmed": self.threads_prewarmed,
+        }
+
+    async def create_thread_message(self, thread_id, user_message):
+        logger.debug(f"Creating message in thread {thread_id}")
+        await self.client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=[{"type": "text", "text": user_message}],
+        )
+
+    async def create_run(self, thread_id):
+        return await retry_call(
+            lambda: self.run_once(thread_id),
+            attempts=self.max_retries,
+            timeout=self.timeout,
+            name=f"run in thread {thread_id}",
+        )
+
+    async def run_once(self, thread_id):
+        cancellation = self._run_cancellations.get(thread_id)
+        if cancellation is not None:
+            # Retrying after a timeout: let the old run stop first
+            await asyncio.wait({cancellation}, timeout=RUN_CANCEL_TIMEOUT)
+        try:
+            if self.run_mode == "stream":
+                run = await self.stream_run(thread_id)
+            else:
+                run = await self.poll_run(thread_id)
+        except asyncio.CancelledError:
+            # Stop the run server-side too, e.g. after a timeout or when a
+            # hedged call lost
+            self.cancel_in_background(thread_id)
+            raise
+
+        logger.info("Run completed successfully")
+        record_usage(run.usage)
+        return run
+
+    def response_options(self):
+        if self.response_model is None:
+            return {}
+        return {"response_format": response_format(self.response_model)}
+
+    async def stream_run(self, thread_id):
+        """Run the assistant and return as soon as the run-finished event arrives.
+
+        A failed run raises inside the limiter guard, so rate-limited runs
+        count towards opening the circuit.
+        """
+        assistant = await self.get_assistant()
+        async with self.limits.guard("openai", assistant.model):
+            async with self.client.beta.threads.runs.stream(
+                thread_id=thread_id,
+                assistant_id=self.assistant_id,
+                **self.response_options(),
+            ) as stream:
+                return check_run(await stream.get_final_run(), thread_id)
+
+    async def poll_run(self, thread_id):
+        """Run the assistant, polling with jittered exponential backoff.
+
+        The first checks come after tens of milliseconds, so short runs are
+        noticed quickly, and the interval grows up to POLL_MAX_INTERVAL for
+        long ones.
+        """
+        assistant = await self.get_assistant()
+        async with self.limits.guard("openai", assistant.model):
+            run = await self.client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=self.assistant_id,
+                **self.response_options(),
+            )
+            interval = POLL_MIN_INTERVAL
+            while run.status == "queued" or run.status == "in_progress":
+                logger.debug(f"Run status: {run.status}")
+                await asyncio.sleep(random.uniform(interval / 2, interval))
+                interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+                run = await self.client.beta.threads.runs.retrieve(
+                    thread_id=thread_id, run_id=run.id
+                )
+            return check_run(run, thread_id)
+
+    async def get_answer(self, thread_id):
+        logger.debug(f"Getting answer from thread {thread_id}")
+        resp = await self.client.beta.threads.messages.list(thread_id=thread_id)
+        return resp.data[0].content[0].text.value
+
+    async def transcribe_audio(self, audio_file_path):
+        logger.debug(f"Transcribing audio file: {audio_file_path}")
+        with open(audio_file_path, "rb") as audio_file:
+            async with self.limits.guard("openai", "whisper-1"):
+                transcription = (
+                    await self.client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=audio_file,
+                    )
+                ).text
+        logger.debug("Audio transcription completed")
+        return transcription
+
+    async def complete_with_assistant(self, responses):
+        thread = await self.create_thread()
+        await self.create_thread_message(thread.id, responses)
+        await self.create_run(thread.id)
+        return await self.get_answer(thread.id)
+
+    def cancel_in_background(self, thread_id):
+        task = asyncio.create_task(self.cancel_active_run(thread_id))
+        self._run_cancellations[thread_id] = task
+        task.add_done_callback(lambda _: self._run_cancellations.pop(thread_id, None))
+
+    async def cancel_active_run(self, thread_id):
+        """Cancel the thread's active run and wait until it has stopped."""
+        deadline = time.monotonic() + RUN_CANCEL_TIMEOUT
+        try:
+            runs = await self.client.beta.threads.runs.list(
+                thread_id=thread_id, limit=1
+            )
+            for run in runs.data:
+                if run.status not in ACTIVE_RUN_STATUSES:
+                    continue
+                if run.status != "cancelling":
+                    logger.debug(f"Cancelling run {run.id} in thread {thread_id}")
+                    run = await self.client.beta.threads.runs.cancel(
+                        thread_id=thread_id, run_id=run.id
+                    )
+                while run.status in ACTIVE_RUN_STATUSES and time.monotonic() < deadline:
+                    await asyncio.sleep(POLL_MAX_INTERVAL)
+                    run = await self.client.beta.threads.runs.retrieve(
+                        thread_id=thread_id, run_id=run.id
+                    )
+        except Exception as e:
+            logger.warning(f"Failed to cancel run in thread {thread_id}: {str(e)}")
+
+    async def complete_with_chat(self, responses):
+        """Answer with a single chat completion using the assistant's settings.
+
+        One HTTP round trip instead of the thread, message, run and message
+        list calls of the Assistants API; returns the same text.
+        """
+        assistant = await self.get_assistant()
+        completion = await retry_call(
+            lambda: self.create_chat_completion(assistant, responses),
+            attempts=self.max_retries,
+            timeout=self.timeout,
+            name=f"chat completion with {assistant.model}",
+        )
+        record_usage(completion.usage)
+        return completion.choices[0].message.content
+
+    async def create_chat_completion(self, assistant, responses):
+        logger.debug(f"Creating chat completion with model {assistant.model}")
+        async with self.limits.guard("openai", assistant.model):
+            completion = await self.client.chat.completions.create(
+                model=assistant.model,
+                messages=[
+                    {"role": "system", "content": assistant.instructions or ""},
+                    {"role": "user", "content": responses},
+                ],
+                temperature=assistant.temperature,
+                top_p=assistant.top_p,
+                **self.response_options(),
+            )
+        return completion
+
+    async def handle_message(self, responses):
+        logger.info(f"Starting message handling process ({self.backend} backend)")
+        if self.cache is not None:
+            cache_key = await self.get_cache_key(responses)
+            answer = await self.cache.get(cache_key)
+            if answer is not None:
+                logger.info("Message handling completed from cache")
+                return answer
+
+        answer = await self.complete_hedged(responses)
+
+        if self.cache is not None:
+            await self.cache.set(cache_key, answer)
+        logger.info("Message handling completed")
+        return answer
+
+    async def complete(self, responses):
+        if self.backend == "chat":
+            return await self.complete_with_chat(responses)
+        return await self.complete_with_assistant(responses)
+
+    def hedge_delay(self):
+        """Latency after which a call is hedged, or None if hedging is off."""
+        if not self.hedge_percentile or len(self.latencies) < self.hedge_min_samples:
+            return None
+        # Nearest-rank percentile
+        samples = sorted(self.latencies)
+        index = math.ceil(len(samples) * self.hedge_percentile / 100) - 1
+        return samples[min(max(index, 0), len(samples) - 1)]
+
+    async def complete_hedged(self, responses):
+        """Complete responses, racing a duplicate call if the first one is slow.
+
+        The first successful call wins and the other is cancelled, including
+        its run on the Assistants API. The latency sample is measured from the
+        start of the first call, so a slow call that lost to its hedge still
+        counts in full.
+        """
+        start = time.monotonic()
+        answer = await self.race_hedge(responses, self.hedge_delay())
+        self.latencies.append(time.monotonic() - start)
+        return answer
+
+    async def race_hedge(self, responses, delay):
+        if delay is None:
+            return await self.complete(responses)
+
+        self.hedge_calls += 1
+        primary = asyncio.create_task(self.complete(responses))
+        tasks = {primary}
+        try:
+            done, tasks = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            if self.hedges >= self.hedge_max_rate * self.hedge_calls:
+                return await primary
+
+            self.hedges += 1
+            logger.info(f"Call still running after {delay:.1f}s, sending hedge")
+            hedge = asyncio.create_task(self.complete(responses))
+            tasks = {primary, hedge}
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def hedge_stats(self):
+        return {
+            "calls": self.hedge_calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges / self.hedge_calls if self.hedge_calls else 0.0,
+            "delay": self.hedge_delay(),
+        }
+
+    async def invalidate(self, responses):
+        """Drop the cached answer for responses, e.g. when it failed to parse."""
+        if self.cache is not None:
+            await self.cache.invalidate(await self.get_cache_key(responses))
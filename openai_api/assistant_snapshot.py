@@ -0,0 +1,44 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class AssistantSnapshotStore:
+    """Local JSON snapshot of assistant metadata.
+
+    Lets managers start from the last known assistant configuration instead
+    of blocking on assistants.retrieve; the live metadata is fetched in the
+    background and written back here.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshots = None
+
+    def _load_all(self):
+        if self.snapshots is None:
+            try:
+                with open(self.path, encoding="utf-8") as snapshot_file:
+                    self.snapshots = json.load(snapshot_file)
+            except FileNotFoundError:
+                self.snapshots = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable assistant snapshot: {str(e)}")
+                self.snapshots = {}
+        return self.snapshots
+
+    def load(self, assistant_id):
+        return self._load_all().get(assistant_id)
+
+    def save(self, assistant_id, data):
+        snapshots = self._load_all()
+        snapshots[assistant_id] = data
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(snapshots, snapshot_file, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write assistant snapshot: {str(e)}")
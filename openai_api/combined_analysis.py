@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import logging
+
+from openai_api.schemas import response_format
+from openai_api.usage import record_usage
+from resilience.rate_limit import rate_limits
+from resilience.retry import DEFAULT_ATTEMPTS, retry_call
+
+logger = logging.getLogger(__name__)
+
+COMBINED_INSTRUCTIONS = (
+    "You evaluate the same user responses against several rubrics. Apply each "
+    "rubric independently, exactly as its instructions below say. Reply with one "
+    "block per rubric, wrapped in tags named after it (for example "
+    "<vocabulary>...</vocabulary>), each holding that rubric's complete answer."
+)
+
+# Used instead of the tag format when the answer is a JSON schema
+COMBINED_STRUCTURED_INSTRUCTIONS = (
+    "You evaluate the same user responses against several rubrics. Apply each "
+    "rubric independently, exactly as its instructions below say, and put its "
+    "answer under the rubric's name in the JSON response."
+)
+
+
+class CombinedAnalysisManager:
+    """Runs several rubric assistants as one chat completion.
+
+    The system prompt is composed from the instructions of each rubric
+    assistant, so the input is sent once instead of once per rubric. It has
+    the handle_message/invalidate interface of AsyncAssistantManager; the
+    answer holds one <rubric>...</rubric> block per rubric, or one JSON
+    object per rubric when response_model is given.
+    """
+
+    def __init__(
+        self,
+        client,
+        rubric_managers,
+        cache=None,
+        model=None,
+        limits=rate_limits,
+        response_model=None,
+        timeout=None,
+        max_retries=DEFAULT_ATTEMPTS,
+    ):
+        self.client = client
+        self.rubric_managers = rubric_managers
+        self.cache = cache
+        self.model = model
+        self.limits = limits
+        self.response_model = response_model
+        # Same per-attempt timeout and attempts as the rubric agents
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.assistant_id = "combined:" + "+".join(rubric_managers)
+
+    async def get_settings(self):
+        assistants = await asyncio.gather(
+            *(manager.get_assistant() for manager in self.rubric_managers.values())
+        )
+        sections = [
+            f'<rubric name="{name}">\n{assistant.instructions or ""}\n</rubric>'
+            for name, assistant in zip(self.rubric_managers, assistants)
+        ]
+        if self.response_model is not None:
+            header = COMBINED_STRUCTURED_INSTRUCTIONS
+        else:
+            header = COMBINED_INSTRUCTIONS
+        instructions = "\n\n".join([header, *sections])
+        return self.model or assistants[0].model, instructions, assistants[0]
+
+    def response_options(self):
+        if self.response_model is None:
+            return {}
+        return {"response_format": response_format(self.response_model)}
+
+    async def get_cache_key(self, responses):
+        model, instructions, _ = await self.get_settings()
+        version = hashlib.sha256(
+            f"{model}\n{instructions}".encode("utf-8")
+        ).hexdigest()[:16]
+        return self.cache.make_key(self.assistant_id, version, responses)
+
+    async def handle_message(self, responses):
+        logger.info(f"Starting combined analysis of {list(self.rubric_managers)}")
+        if self.cache is not None:
+            cache_key = await self.get_cache_key(responses)
+            answer = await self.cache.get(cache_key)
+            if answer is not None:
+                logger.info("Combined analysis completed from cache")
+                return answer
+
+        model, instructions, assistant = await self.get_settings()
+        completion = await retry_call(
+            lambda: self.create_completion(model, instructions, assistant, responses),
+            attempts=self.max_retries,
+            timeout=self.timeout,
+            name=f"combined analysis with {model}",
+        )
+        record_usage(completion.usage)
+        answer = completion.choices[0].message.content
+
+        if self.cache is not None:
+            await self.cache.set(cache_key, answer)
+        logger.info("Combined analysis completed")
+        return answer
+
+    async def create_completion(self, model, instructions, assistant, responses):
+        async with self.limits.guard("openai", model):
+            return await self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": responses},
+                ],
+                temperature=assistant.temperature,
+                top_p=assistant.top_p,
+                **self.response_options(),
+            )
+
+    async def invalidate(self, responses):
+        if self.cache is not None:
+            await self.cache.invalidate(await self.get_cache_key(responses))
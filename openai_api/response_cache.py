@@ -0,0 +1,89 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config.logger_config import logger
+
+logger = logger.getChild("response_cache")
+
+
+def normalize_input(message):
+    """Normalize an agent input so trivially different copies share a key."""
+    message = unicodedata.normalize("NFC", message)
+    return re.sub(r"\s+", " ", message).strip()
+
+
+class ResponseCache:
+    """Content-addressed cache of agent responses.
+
+    Entries are keyed on (assistant id, instructions version, normalized input
+    hash). The first tier is an in-memory LRU; when a database manager is given,
+    responses are also stored in Postgres so they survive restarts and are
+    shared between processes. Both tiers expire entries after ttl seconds.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 60 * 60, db_manager=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_manager = db_manager
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(assistant_id, instructions_version, message):
+        input_hash = hashlib.sha256(
+            normalize_input(message).encode("utf-8")
+        ).hexdigest()
+        return f"{assistant_id}:{instructions_version}:{input_hash}"
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                logger.debug(f"Memory cache hit for {key} ({self.stats()})")
+                return response
+            del self.entries[key]
+
+        if self.db_manager is not None:
+            response = await self.db_manager.get_cached_response(key)
+            if response is not None:
+                self._remember(key, response)
+                self.persistent_hits += 1
+                logger.debug(f"Persistent cache hit for {key} ({self.stats()})")
+                return response
+
+        self.misses += 1
+        logger.debug(f"Cache miss for {key} ({self.stats()})")
+        return None
+
+    async def set(self, key, response):
+        self._remember(key, response)
+        if self.db_manager is not None:
+            await self.db_manager.save_cached_response(key, response, self.ttl)
+
+    async def invalidate(self, key):
+        self.entries.pop(key, None)
+        if self.db_manager is not None:
+            await self.db_manager.delete_cached_response(key)
+        logger.debug(f"Invalidated cache entry {key}")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+        }
+
+    def _remember(self, key, response):
+        self.entries[key] = (time.time() + self.ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,113 @@
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class StrictModel(BaseModel):
+    # additionalProperties: false, as required by strict structured outputs
+    model_config = ConfigDict(extra="forbid")
+
+
+class Criterion(StrictModel):
+    name: str
+    score: float
+    max_score: float
+    justification: str
+
+
+class Overall(StrictModel):
+    score: float
+    max_score: float
+    strengths: list[str]
+    areas_for_improvement: list[str]
+    summary: str
+
+
+class Feedback(StrictModel):
+    strengths: list[str] = Field(
+        alias="Specific examples that demonstrate strong skills"
+    )
+    improvements: list[str] = Field(alias="Areas where improvement is needed")
+    exercises: list[str] = Field(alias="Suggested exercises or practice activities")
+    recommendations: list[str] = Field(
+        alias="General recommendations for further development"
+    )
+
+
+class RubricAnalysis(StrictModel):
+    """Answer of a rubric agent (vocabulary, tense, style or grammar)."""
+
+    criteria: list[Criterion]
+    overall: Overall
+    feedback: Feedback
+
+    def to_result(self):
+        """Return (evaluation, feedback) in the shape the PDF report reads."""
+        evaluation = {
+            criterion.name: criterion.model_dump(exclude={"name"})
+            for criterion in self.criteria
+        }
+        evaluation["overall"] = self.overall.model_dump()
+        return evaluation, self.feedback.model_dump(by_alias=True)
+
+
+class CombinedAnalysis(StrictModel):
+    """Answer of the single-call analysis covering all four rubrics."""
+
+    vocabulary: RubricAnalysis
+    tense: RubricAnalysis
+    style: RubricAnalysis
+    grammar: RubricAnalysis
+
+
+class Introduction(StrictModel):
+    summary: str
+    key_areas_for_improvement: list[str]
+
+
+class PeriodPlan(StrictModel):
+    goals: list[str]
+    action_steps: list[str]
+
+
+class ImprovementPlan(StrictModel):
+    one_month: PeriodPlan = Field(alias="1_month_plan")
+    three_months: PeriodPlan = Field(alias="3_month_plan")
+    six_months: PeriodPlan = Field(alias="6_month_plan")
+    twelve_months: PeriodPlan = Field(alias="12_month_plan")
+
+
+class ActionSchedule(StrictModel):
+    daily_actions: list[str]
+    weekly_actions: list[str]
+    monthly_actions: list[str]
+
+
+class ResourceGroup(StrictModel):
+    type: str
+    items: list[str]
+
+
+class StudyPlan(StrictModel):
+    """Answer of the study plan agent."""
+
+    introduction: Introduction
+    detailed_improvement_plan: ImprovementPlan
+    action_schedule: ActionSchedule
+    resources: list[ResourceGroup]
+
+    def to_report(self):
+        """Return the study plan in the shape the PDF report reads."""
+        study_plan = self.model_dump(by_alias=True)
+        study_plan["resources"] = {group.type: group.items for group in self.resources}
+        return study_plan
+
+
+def response_format(model):
+    """OpenAI response_format requesting JSON that matches a strict schema."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": model.model_json_schema(),
+            "strict": True,
+        },
+    }
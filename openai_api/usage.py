@@ -0,0 +1,70 @@
+import contextlib
+import contextvars
+
+# Usage accumulator of the current task and the tasks it spawns
+current_usage = contextvars.ContextVar("current_usage", default=None)
+
+
+class TokenUsage:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, usage):
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+
+
+@contextlib.contextmanager
+def track_usage():
+    """Count the tokens of every model call made inside the block.
+
+    Tasks created inside the block inherit the context, so calls made
+    concurrently through asyncio.gather are counted too.
+    """
+    usage = TokenUsage()
+    token = current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        current_usage.reset(token)
+
+
+def record_usage(usage):
+    """Add a completion or run usage object to the tracked usage, if any."""
+    tracked = current_usage.get()
+    if tracked is not None and usage is not None:
+        tracked.add(usage)
+
+
+class ModeStats:
+    """Running latency and token totals per analysis mode, for comparison."""
+
+    def __init__(self):
+        self.modes = {}
+
+    def record(self, mode, latency, usage):
+        totals = self.modes.setdefault(
+            mode, {"runs": 0, "latency": 0.0, "calls": 0, "tokens": 0}
+        )
+        totals["runs"] += 1
+        totals["latency"] += latency
+        totals["calls"] += usage.calls
+        totals["tokens"] += usage.total_tokens
+
+    def stats(self):
+        return {
+            mode: {
+                "runs": totals["runs"],
+                "average_latency": totals["latency"] / totals["runs"],
+                "average_calls": totals["calls"] / totals["runs"],
+                "average_tokens": totals["tokens"] / totals["runs"],
+            }
+            for mode, totals in self.modes.items()
+        }
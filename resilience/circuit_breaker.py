@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from config.logger_config import logger
+
+logger = logger.getChild("circuit_breaker")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit {name} is open, retry in {retry_after:.0f} seconds")
+
+
+def is_provider_failure(error):
+    """Whether an error means the provider is overloaded or unavailable.
+
+    Rate limits (429), server errors (5xx), timeouts and connection errors
+    count; client errors such as a bad request do not, since retrying them
+    elsewhere would fail the same way.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # google.api_core exceptions carry the HTTP status as code
+        status = getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class CircuitBreaker:
+    """Fails fast while a provider is down.
+
+    After failure_threshold consecutive provider failures the circuit opens
+    and calls raise CircuitOpenError without reaching the provider. Once
+    reset_timeout seconds have passed one probe call is let through: success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not reach the provider."""
+        if self.state == "closed":
+            return
+        retry_after = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == "open" and retry_after <= 0:
+            logger.info(f"Circuit {self.name} half-open, sending a probe call")
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(retry_after, 0))
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit {self.name} closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if (
+            self.state == "half_open"
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state != "open":
+                self.times_opened += 1
+                logger.error(
+                    f"Circuit {self.name} opened after "
+                    f"{self.consecutive_failures} consecutive failures"
+                )
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_ignored(self):
+        """Release a probe whose outcome says nothing about provider health."""
+        self.probe_in_flight = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import contextvars
+import time
+
+from config.logger_config import logger
+from resilience.circuit_breaker import CircuitBreaker, is_provider_failure
+
+logger = logger.getChild("rate_limit")
+
+# Event loop time by which the current attempt must finish, set by retry_call
+attempt_deadline = contextvars.ContextVar("attempt_deadline", default=None)
+
+
+def attempt_timed_out():
+    """Whether the current attempt has reached its retry_call deadline."""
+    deadline = attempt_deadline.get()
+    return deadline is not None and asyncio.get_running_loop().time() >= deadline
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would wait too long for a rate limit token."""
+
+    def __init__(self, name, reason):
+        self.name = name
+        super().__init__(f"Rate limit {name}: {reason}")
+
+
+class TokenBucket:
+    """Token bucket allowing rate calls per second with bursts of up to burst.
+
+    Callers wait their turn in FIFO order. A call is rejected right away when
+    max_queue callers are already waiting, or when its expected wait exceeds
+    max_wait seconds, so a burst is shed instead of piling up.
+    """
+
+    def __init__(self, name, rate, burst, max_queue=100, max_wait=60):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded(self.name, f"{self.waiting} calls already queued")
+
+        started_at = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                self._refill()
+                if self.tokens < 1:
+                    delay = (1 - self.tokens) / self.rate
+                    if time.monotonic() - started_at + delay > self.max_wait:
+                        self.rejected += 1
+                        raise RateLimitExceeded(
+                            self.name, f"expected wait over {self.max_wait} seconds"
+                        )
+                    await asyncio.sleep(delay)
+                    self._refill()
+                self.tokens -= 1
+        finally:
+            self.waiting -= 1
+
+        self.acquired += 1
+        self.total_wait += time.monotonic() - started_at
+
+    def stats(self):
+        return {
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "average_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+        }
+
+
+class ProviderLimiter:
+    """Token bucket and circuit breaker guarding calls to one provider model."""
+
+    def __init__(
+        self,
+        name,
+        rate,
+        burst,
+        max_queue=100,
+        max_wait=60,
+        failure_threshold=5,
+        reset_timeout=30,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(name, rate, burst, max_queue, max_wait)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+
+    @contextlib.asynccontextmanager
+    async def guard(self):
+        """Wait for a token, then run the body and record its outcome."""
+        self.breaker.before_call()
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.breaker.record_ignored()
+            raise
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Cancelled by retry_call's per-attempt timeout: the provider did
+            # not answer in time, unlike a hedge that lost or a shutdown
+            if attempt_timed_out():
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_ignored()
+            raise
+        except Exception as e:
+            if is_provider_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_ignored()
+            raise
+        except BaseException:
+            self.breaker.record_ignored()
+            raise
+        else:
+            self.breaker.record_success()
+
+    def stats(self):
+        return {**self.bucket.stats(), "circuit": self.breaker.stats()}
+
+
+class RateLimiterRegistry:
+    """Process-wide limiters, one per (provider, model).
+
+    Each provider is configured once with its limits; a limiter is created the
+    first time a model of that provider is used. Calls to providers that were
+    never configured are not limited.
+    """
+
+    def __init__(self):
+        self.policies = {}
+        self.limiters = {}
+
+    def configure(self, provider, **policy):
+        self.policies[provider] = policy
+
+    def get(self, provider, model):
+        if provider not in self.policies:
+            return None
+        key = (provider, model)
+        if key not in self.limiters:
+            logger.debug(f"Creating rate limiter for {provider}/{model}")
+            self.limiters[key] = ProviderLimiter(
+                f"{provider}/{model}", **self.policies[provider]
+            )
+        return self.limiters[key]
+
+    def guard(self, provider, model):
+        limiter = self.get(provider, model)
+        if limiter is None:
+            return contextlib.nullcontext()
+        return limiter.guard()
+
+    def stats(self):
+        return {limiter.name: limiter.stats() for limiter in self.limiters.values()}
+
+
+rate_limits = RateLimiterRegistry()
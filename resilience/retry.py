@@ -0,0 +1,55 @@
+import asyncio
+import random
+
+from config.logger_config import logger
+from resilience.circuit_breaker import CircuitOpenError
+from resilience.rate_limit import RateLimitExceeded, attempt_deadline
+
+logger = logger.getChild("retry")
+
+DEFAULT_ATTEMPTS = 5
+
+
+async def backoff(attempt):
+    """Sleep with full jitter so concurrent retries do not arrive together."""
+    delay = random.uniform(0, 2**attempt)
+    logger.info(f"Retrying in {delay:.1f} seconds")
+    await asyncio.sleep(delay)
+
+
+async def retry_call(call, attempts=DEFAULT_ATTEMPTS, timeout=None, name="call"):
+    """Await call() with a per-attempt timeout, retrying failures with backoff.
+
+    This is the policy every model call uses. Rejections by the rate limiter or
+    an open circuit are raised right away: retrying would only add load to a
+    saturated provider. The attempt's deadline is visible to the limiter
+    guards, so an attempt that times out counts as a provider failure.
+
+    Args:
+        call (callable): Zero-argument coroutine function making one attempt
+        attempts (int): Maximum number of attempts
+        timeout (float): Seconds allowed per attempt, or None for no limit
+        name (str): Description used in log messages
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        deadline = None
+        if timeout is not None:
+            deadline = asyncio.get_running_loop().time() + timeout
+        token = attempt_deadline.set(deadline)
+        try:
+            logger.debug(f"Starting {name} (attempt {attempt}/{attempts})")
+            return await asyncio.wait_for(call(), timeout)
+        except (CircuitOpenError, RateLimitExceeded):
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                logger.error(f"{name} timed out after {timeout} seconds")
+            else:
+                logger.error(f"Error during {name}: {str(e)}", exc_info=True)
+            if attempt >= attempts:
+                raise
+        finally:
+            attempt_deadline.reset(token)
+        await backoff(attempt)